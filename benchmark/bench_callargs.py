@@ -0,0 +1,36 @@
+"""
+Micro-benchmark: binding call arguments to names
+
+usage: PYTHONPATH=src python benchmark/bench_callargs.py
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import sys
+import timeit
+
+if sys.version_info < (2, 7):
+    from mog_commons.backported.inspect2 import getcallargs as inspect_getcallargs
+else:
+    from inspect import getcallargs as inspect_getcallargs
+from mog_commons.callargs import getcallargs
+
+
+def f(s, encoding=None, errors='strict', *args, **kwargs):
+    pass
+
+
+def main(number=100000):
+    cases = [
+        ('positional', ('abc', 'utf-8'), {}),
+        ('defaults', ('abc',), {}),
+        ('keywords', ('abc',), {'errors': 'ignore', 'x': 1}),
+    ]
+    print('%-12s %14s %14s %8s' % ('case', 'inspect(usec)', 'cached(usec)', 'speedup'))
+    for name, args, kwargs in cases:
+        t0 = timeit.timeit(lambda: inspect_getcallargs(f, *args, **kwargs), number=number) / number * 1e6
+        t1 = timeit.timeit(lambda: getcallargs(f, *args, **kwargs), number=number) / number * 1e6
+        print('%-12s %14.3f %14.3f %7.1fx' % (name, t0, t1, t0 / t1))
+
+
+if __name__ == '__main__':
+    main()
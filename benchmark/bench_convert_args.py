@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-benchmark: converting command line arguments to bytes
+
+usage: PYTHONPATH=src python benchmark/bench_convert_args.py
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import timeit
+from mog_commons import command
+from mog_commons.string import to_bytes
+
+convert_args = getattr(command, '__convert_args')
+
+
+def convert_args_checked(args, cmd_encoding):
+    """argument conversion with the type-checked to_bytes"""
+    return [to_bytes(a, cmd_encoding) for a in args]
+
+
+def main(number=2000):
+    args = ['command', '--option', 'value', 'あいうえお', '/path/to/file'] * 20
+    print('%-10s %18s %18s %8s' % ('encoding', 'checked(args/s)', 'unchecked(args/s)', 'speedup'))
+    for encoding in ['utf-8', 'sjis']:
+        t0 = timeit.timeit(lambda: convert_args_checked(args, encoding), number=number)
+        t1 = timeit.timeit(lambda: convert_args(args, False, encoding), number=number)
+        n = len(args) * number
+        print('%-10s %18.0f %18.0f %7.1fx' % (encoding, n / t0, n / t1, t0 / t1))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,34 @@
+"""
+Micro-benchmark: converting environment variables for subprocess
+
+usage: PYTHONPATH=src python benchmark/bench_convert_env.py
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import os
+import timeit
+from mog_commons import command
+
+convert_env = getattr(command, '__convert_env')
+
+
+def convert_env_uncached(env, encoding):
+    """conversion without the cache, which encodes all the variables every time"""
+    d = dict(os.environ, **env)
+    return dict((k.encode(encoding), v.encode(encoding)) for k, v in d.items())
+
+
+def main(number=2000):
+    for i in range(200):
+        os.environ.setdefault('MOG_COMMONS_BENCH_%d' % i, 'value-%d' % i)
+    env = {'LANG': 'C', 'MOG_COMMONS_BENCH': 'x'}
+
+    print('%-10s %18s %18s %8s' % ('overrides', 'uncached(calls/s)', 'cached(calls/s)', 'speedup'))
+    for name, e in [('none', {}), ('2', env)]:
+        t0 = timeit.timeit(lambda: convert_env_uncached(e, 'utf-8'), number=number)
+        t1 = timeit.timeit(lambda: convert_env(e, 'utf-8'), number=number)
+        print('%-10s %18.0f %18.0f %7.1fx' % (name, number / t0, number / t1, t0 / t1))
+
+
+if __name__ == '__main__':
+    main()
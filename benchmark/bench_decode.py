@@ -0,0 +1,50 @@
+"""
+Micro-benchmark: encoding detection for unicode_decode
+
+usage: PYTHONPATH=src python benchmark/bench_decode.py
+"""
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import io
+import os
+import timeit
+from mog_commons.collection import distinct
+from mog_commons.string import unicode_decode, detect_encoding
+
+RESOURCE_DIR = os.path.join(os.path.dirname(__file__), '..', 'tests', 'resources')
+
+
+def sequential_decode(data, encoding_list):
+    """unicode_decode without detection"""
+    first_exp = None
+    for i, encoding in enumerate(distinct(encoding_list)):
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError as e:
+            if i == 0:
+                first_exp = e
+    raise first_exp
+
+
+def load(name, repeat):
+    with io.open(os.path.join(RESOURCE_DIR, name), 'rb') as f:
+        return f.read() * repeat
+
+
+def main(number=20):
+    cases = [
+        ('utf8_ja.txt', ['ascii', 'euc-jp', 'sjis', 'utf-8']),
+        ('sjis_ja.txt', ['ascii', 'euc-jp', 'utf-8', 'sjis']),
+    ]
+    print('%-12s %8s %14s %14s %14s' % ('file', 'size', 'detect(msec)', 'seq(msec)', 'decode(msec)'))
+    for name, encodings in cases:
+        for repeat in [1000, 100000]:
+            data = load(name, repeat)
+            t0 = timeit.timeit(lambda: detect_encoding(data, encodings), number=number) / number * 1e3
+            t1 = timeit.timeit(lambda: sequential_decode(data, encodings), number=number) / number * 1e3
+            t2 = timeit.timeit(lambda: unicode_decode(data, encodings), number=number) / number * 1e3
+            print('%-12s %8d %14.3f %14.3f %14.3f' % (name, len(data), t0, t1, t2))
+
+
+if __name__ == '__main__':
+    main()
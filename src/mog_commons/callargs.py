@@ -0,0 +1,115 @@
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import sys
+import weakref
+from inspect import ismethod
+import six
+
+if sys.version_info < (2, 7):
+    from mog_commons.backported.inspect2 import getcallargs as _getcallargs
+else:
+    from inspect import getcallargs as _getcallargs
+
+if six.PY2:
+    from inspect import getargspec as _getargspec
+else:
+    from inspect import getfullargspec as _getargspec
+
+__all__ = [
+    'ArgSpec',
+    'get_argspec',
+    'getcallargs',
+]
+
+
+class ArgSpec(object):
+    """Argument metadata of a function, which is computed once per function object"""
+
+    def __init__(self, func):
+        spec = _getargspec(func)
+        self.args = tuple(spec[0])
+        self.varargs = spec[1]
+        self.varkw = spec[2]
+        self.defaults = tuple(spec[3] or ())
+        self.kwonlyargs = tuple(getattr(spec, 'kwonlyargs', None) or ())
+        self.kwonlydefaults = dict(getattr(spec, 'kwonlydefaults', None) or {})
+
+        # names which can be passed by keyword
+        self.keywords = frozenset(self.args + self.kwonlyargs)
+
+        # default values by name
+        self.default_map = dict(zip(self.args[len(self.args) - len(self.defaults):], self.defaults))
+        self.default_map.update(self.kwonlydefaults)
+
+        # number of the names to be bound
+        self.num_names = len(self.args) + len(self.kwonlyargs) + bool(self.varargs) + bool(self.varkw)
+
+        # tuple parameters in Python 2 are not supported by the fast binder
+        self.simple = all(isinstance(a, six.string_types) for a in self.args)
+
+
+_argspec_cache = weakref.WeakKeyDictionary()
+
+
+def get_argspec(func):
+    """
+    Get the argument metadata of the function, cached by the function object.
+    :param func: function
+    :return: ArgSpec
+    """
+    try:
+        return _argspec_cache[func]
+    except KeyError:
+        spec = _argspec_cache[func] = ArgSpec(func)
+        return spec
+
+
+def getcallargs(func, *positional, **named):
+    """
+    Get the mapping of arguments to values, as inspect.getcallargs does.
+
+    The argument metadata is cached per function object. Invalid calls and unusual signatures are delegated
+    to inspect.getcallargs (or its backport), so the error messages are the same.
+    """
+    if ismethod(func) and six.get_method_self(func) is not None:
+        # implicit 'self' (or 'cls' for classmethods) argument
+        spec = get_argspec(six.get_method_function(func))
+        values = (six.get_method_self(func),) + positional
+    else:
+        spec = get_argspec(func)
+        values = positional
+
+    args = spec.args
+    num_args = len(args)
+    if not spec.simple or (len(values) > num_args and not spec.varargs):
+        return _getcallargs(func, *positional, **named)
+
+    ret = dict(zip(args, values))
+    if spec.varargs:
+        ret[spec.varargs] = values[num_args:]
+
+    if named:
+        kw = {} if spec.varkw else None
+        keywords = spec.keywords
+        for k, v in named.items():
+            if k in ret:
+                return _getcallargs(func, *positional, **named)
+            elif k in keywords:
+                ret[k] = v
+            elif kw is not None:
+                kw[k] = v
+            else:
+                return _getcallargs(func, *positional, **named)
+        if kw is not None:
+            ret[spec.varkw] = kw
+    elif spec.varkw:
+        ret[spec.varkw] = {}
+
+    if len(ret) < spec.num_names:
+        default_map = spec.default_map
+        for name in args + spec.kwonlyargs:
+            if name not in ret:
+                if name not in default_map:
+                    return _getcallargs(func, *positional, **named)
+                ret[name] = default_map[name]
+    return ret
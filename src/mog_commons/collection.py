@@ -1,8 +1,9 @@
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import threading
 import six
 
-__all__ = ['get_single_item', 'get_single_key', 'get_single_value', 'distinct']
+__all__ = ['get_single_item', 'get_single_key', 'get_single_value', 'distinct', 'LRUCache']
 
 
 def get_single_item(d):
@@ -28,3 +29,83 @@ def distinct(xs):
     # don't use collections.OrderedDict because we do support Python 2.6
     seen = set()
     return [x for x in xs if x not in seen and not seen.add(x)]
+
+
+class LRUCache(object):
+    """
+    Bounded mapping which discards the least recently used item
+
+    The number of hits and misses of get() is recorded. The cache can be shared among threads.
+    """
+
+    # don't use collections.OrderedDict because we do support Python 2.6
+    _PREV, _NEXT, _KEY, _VALUE = 0, 1, 2, 3
+
+    def __init__(self, maxsize):
+        assert maxsize > 0, 'maxsize must be positive.'
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._map = {}
+        self._root = []
+        self._lock = threading.Lock()
+        self.clear()
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def get(self, key, default=None):
+        """Get the value and mark it as the most recently used."""
+        with self._lock:
+            link = self._map.get(key)
+            if link is None:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self._move_to_last(link)
+            return link[self._VALUE]
+
+    def put(self, key, value):
+        """Set the value, discarding the least recently used item if the cache is full."""
+        with self._lock:
+            link = self._map.get(key)
+            if link is not None:
+                link[self._VALUE] = value
+                self._move_to_last(link)
+                return
+
+            root = self._root
+            if len(self._map) >= self.maxsize:
+                oldest = root[self._NEXT]
+                oldest[self._PREV][self._NEXT] = oldest[self._NEXT]
+                oldest[self._NEXT][self._PREV] = oldest[self._PREV]
+                del self._map[oldest[self._KEY]]
+
+            last = root[self._PREV]
+            link = [last, root, key, value]
+            last[self._NEXT] = root[self._PREV] = self._map[key] = link
+
+    def clear(self):
+        """Remove all the items. Statistics are kept."""
+        with self._lock:
+            self._map.clear()
+            self._root[:] = [self._root, self._root, None, None]
+
+    def info(self):
+        """
+        :return: dict of hits, misses, maxsize and the current size
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'maxsize': self.maxsize, 'size': len(self._map)}
+
+    def _move_to_last(self, link):
+        root = self._root
+        link[self._PREV][self._NEXT] = link[self._NEXT]
+        link[self._NEXT][self._PREV] = link[self._PREV]
+        last = root[self._PREV]
+        last[self._NEXT] = root[self._PREV] = link
+        link[self._PREV] = last
+        link[self._NEXT] = root
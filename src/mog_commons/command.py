@@ -3,13 +3,23 @@ from __future__ import division, print_function, absolute_import, unicode_litera
 import sys
 import os
 import errno
+import signal
 import subprocess
 import platform
+import threading
+from collections import deque
+from timeit import default_timer
 import six
-from mog_commons.string import to_bytes
+from six.moves import queue
+from mog_commons.string import to_bytes_unchecked, unicode_decode_stream
 from mog_commons.functional import oget
+from mog_commons.case_class import CaseClass
 from mog_commons.types import types
 
+try:
+    import resource
+except ImportError:
+    resource = None
 
 # workaround for http://bugs.python.org/issue8513
 SHOULD_NOT_USE_BYTES = sys.version_info[:2] == (3, 2)
@@ -25,31 +35,74 @@ def __convert_args(args, shell, cmd_encoding):
     if isinstance(args, six.string_types):
         # input as string
         if not SHOULD_NOT_ENCODE_ARGS:
-            args = to_bytes(args, cmd_encoding)
+            args = to_bytes_unchecked(args, cmd_encoding)
         if SHOULD_NOT_USE_BYTES:
             args = [args]
     else:
         # input as list
         if shell and sys.platform != 'win32':
-            args = [to_bytes(subprocess.list2cmdline(args), cmd_encoding)]
+            args = [to_bytes_unchecked(subprocess.list2cmdline(args), cmd_encoding)]
         else:
             if not SHOULD_NOT_ENCODE_ARGS:
-                args = [to_bytes(a, cmd_encoding) for a in args]
+                args = [to_bytes_unchecked(a, cmd_encoding) for a in args]
     return args
 
 
+class _PreparedEnv(dict):
+    """Environment variables which have already been converted by __convert_env."""
+
+
+# encoded os.environ for each encoding with the snapshot of os.environ, which tells whether the cache is stale
+__environ_cache = {}
+
+
+def __encoded_environ(encoding):
+    """Encode os.environ only when it has changed since the last call."""
+    # compare the underlying dict, which is much faster than encoding all the items
+    raw = getattr(os.environ, '_data', getattr(os.environ, 'data', os.environ))
+    cached = __environ_cache.get(encoding)
+    if cached is not None and cached[0] == raw:
+        return cached[1]
+
+    snapshot = dict(raw)
+    encoded = _PreparedEnv(
+        (to_bytes_unchecked(k, encoding), to_bytes_unchecked(v, encoding)) for k, v in os.environ.items())
+    __environ_cache[encoding] = (snapshot, encoded)
+    return encoded
+
+
 def __convert_env(env, encoding):
     """Environment variables should be bytes not unicode on Windows."""
-    d = dict(os.environ, **(oget(env, {})))
+    if isinstance(env, _PreparedEnv):
+        return env
 
     # workaround for Windows+Python3 environment
-    if not SHOULD_NOT_ENCODE_ARGS:
-        return dict((k.encode(encoding), v.encode(encoding)) for k, v in d.items())
-    else:
-        return d
+    if SHOULD_NOT_ENCODE_ARGS:
+        return _PreparedEnv(os.environ, **(oget(env, {})))
+
+    # merge only the overrides into the cached base environment
+    base = __encoded_environ(encoding)
+    if not env:
+        return base
+    d = _PreparedEnv(base)
+    d.update((to_bytes_unchecked(k, encoding), to_bytes_unchecked(v, encoding)) for k, v in env.items())
+    return d
 
 
-def execute_command(args, shell=False, cwd=None, env=None, stdin=None, stdout=None, stderr=None, cmd_encoding='utf-8'):
+def prepare_env(env=None, cmd_encoding='utf-8'):
+    """
+    Convert environment variables for the commands in advance
+    The result can be passed as env to the functions in this module, which then use it as it is.
+    :param env: environment variables to add to os.environ : dict
+    :param cmd_encoding: command line encoding: string
+    :return: dict: all the environment variables converted for subprocess
+    """
+    # copy not to share the cached dict with the caller
+    return _PreparedEnv(__convert_env(env, cmd_encoding))
+
+
+def execute_command(args, shell=False, cwd=None, env=None, stdin=None, stdout=None, stderr=None, cmd_encoding='utf-8',
+                    timeout=None, max_memory=None, max_cpu_time=None):
     """
     Execute external command
     :param args: command line arguments : [unicode]
@@ -60,14 +113,22 @@ def execute_command(args, shell=False, cwd=None, env=None, stdin=None, stdout=No
     :param stdout: standard output
     :param stderr: standard error
     :param cmd_encoding: command line encoding: string
+    :param timeout: seconds to wait before killing the command, see run_command : float
+    :param max_memory: maximum address space of the command in bytes : int
+    :param max_cpu_time: maximum CPU time of the command in seconds : int
     :return: return code
     """
+    if timeout is not None or max_memory is not None or max_cpu_time is not None:
+        return run_command(args, shell, cwd, env, stdin, stdout, stderr, False, timeout, max_memory, max_cpu_time,
+                           cmd_encoding).returncode
+
     return subprocess.call(
         args=__convert_args(args, shell, cmd_encoding), shell=shell, cwd=cwd, env=__convert_env(env, cmd_encoding),
         stdin=stdin, stdout=stdout, stderr=stderr)
 
 
-def capture_command(args, shell=False, cwd=None, env=None, stdin=None, cmd_encoding='utf-8'):
+def capture_command(args, shell=False, cwd=None, env=None, stdin=None, cmd_encoding='utf-8',
+                    timeout=None, max_memory=None, max_cpu_time=None):
     """
     Execute external command and capture output
     :param args: command line arguments : [string]
@@ -76,8 +137,16 @@ def capture_command(args, shell=False, cwd=None, env=None, stdin=None, cmd_encod
     :param env: environment variables : dict
     :param stdin: standard input
     :param cmd_encoding: command line encoding: string
+    :param timeout: seconds to wait before killing the command, see run_command : float
+    :param max_memory: maximum address space of the command in bytes : int
+    :param max_cpu_time: maximum CPU time of the command in seconds : int
     :return: tuple of return code, stdout data and stderr data
     """
+    if timeout is not None or max_memory is not None or max_cpu_time is not None:
+        r = run_command(args, shell, cwd, env, stdin, None, None, True, timeout, max_memory, max_cpu_time,
+                        cmd_encoding)
+        return r.returncode, r.stdout, r.stderr
+
     p = subprocess.Popen(
         __convert_args(args, shell, cmd_encoding), shell=shell, cwd=cwd, env=__convert_env(env, cmd_encoding),
         stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
@@ -105,6 +174,564 @@ def execute_command_with_pid(args, pid_file=None, shell=False, cwd=None, env=Non
         return ret
 
 
+#
+# Guarded execution
+#
+class CommandResult(CaseClass):
+    """
+    Result of run_command
+
+    returncode is the negative signal number if the command was killed, e.g. by the timeout.
+    stdout and stderr are the captured data, or None if not captured.
+    wall_time, user_time and system_time are in seconds, and max_rss is the maximum resident set size in bytes.
+    The resource usage is None where os.wait4 is unavailable.
+    """
+
+    def __init__(self, returncode, stdout=None, stderr=None, wall_time=0.0, user_time=None, system_time=None,
+                 max_rss=None, timed_out=False):
+        CaseClass.__init__(self,
+                           ('returncode', returncode),
+                           ('stdout', stdout),
+                           ('stderr', stderr),
+                           ('wall_time', wall_time),
+                           ('user_time', user_time),
+                           ('system_time', system_time),
+                           ('max_rss', max_rss),
+                           ('timed_out', timed_out)
+                           )
+
+
+def __get_preexec_fn(new_group, max_memory, max_cpu_time):
+    limits = []
+    if max_memory is not None:
+        limits.append((resource.RLIMIT_AS, max_memory))
+    if max_cpu_time is not None:
+        limits.append((resource.RLIMIT_CPU, max_cpu_time))
+
+    if not new_group and not limits:
+        return None
+
+    def f():
+        # runs in the child process
+        if new_group:
+            os.setpgid(0, 0)
+        for r, value in limits:
+            hard = resource.getrlimit(r)[1]
+            resource.setrlimit(r, (value if hard == resource.RLIM_INFINITY else min(value, hard), hard))
+
+    return f
+
+
+def __wait_with_rusage(p):
+    """Reap the process with os.wait4 instead of Popen.wait to get its resource usage."""
+    while True:
+        try:
+            _, status, rusage = os.wait4(p.pid, 0)
+            break
+        except OSError as e:
+            if e.errno != errno.EINTR:
+                raise
+    p.returncode = -os.WTERMSIG(status) if os.WIFSIGNALED(status) else os.WEXITSTATUS(status)
+    return rusage
+
+
+def run_command(args, shell=False, cwd=None, env=None, stdin=None, stdout=None, stderr=None, capture=False,
+                timeout=None, max_memory=None, max_cpu_time=None, cmd_encoding='utf-8'):
+    """
+    Execute external command with the guardrails, and report its resource usage
+
+    When timeout is given, the command runs in its own process group, and the whole group is killed by SIGKILL
+    when the timeout expires. On Windows, only the command itself is terminated, and its child processes may
+    survive. The resource limits are applied in the child process before executing the command (POSIX only).
+    :param args: command line arguments : [string]
+    :param shell: True when using shell : boolean
+    :param cwd: working directory : string
+    :param env: environment variables : dict
+    :param stdin: standard input
+    :param stdout: standard output (ignored if capture is True)
+    :param stderr: standard error (ignored if capture is True)
+    :param capture: True to capture stdout and stderr : boolean
+    :param timeout: seconds to wait before killing the command, or None to wait forever : float
+    :param max_memory: maximum address space of the command in bytes (RLIMIT_AS) : int
+    :param max_cpu_time: maximum CPU time of the command in seconds (RLIMIT_CPU) : int
+    :param cmd_encoding: command line encoding: string
+    :return: CommandResult
+    """
+    assert timeout is None or timeout > 0, 'timeout must be positive.'
+    assert max_memory is None or max_memory > 0, 'max_memory must be positive.'
+    assert max_cpu_time is None or max_cpu_time > 0, 'max_cpu_time must be positive.'
+    assert resource is not None or (max_memory is None and max_cpu_time is None), \
+        'resource limits are not supported on this platform.'
+
+    return __run_command(args, shell, cwd, env, stdin, stdout, stderr, capture, timeout, max_memory, max_cpu_time,
+                         cmd_encoding)
+
+
+def __run_command(args, shell, cwd, env, stdin, stdout, stderr, capture, timeout, max_memory, max_cpu_time,
+                  cmd_encoding, on_start=None):
+    """
+    :param on_start: function called with the function killing the command, right after the command starts
+    """
+    new_group = timeout is not None and os.name != 'nt'
+    if capture:
+        stdout = stderr = subprocess.PIPE
+
+    # preexec_fn is not safe when other threads are running (e.g. run_many), so it is used only for the
+    # resource limits, and for the process group on Python 2
+    group_options = {}
+    if new_group and six.PY3:
+        group_options = {'process_group': 0} if sys.version_info >= (3, 11) else {'start_new_session': True}
+
+    t = default_timer()
+    p = subprocess.Popen(
+        __convert_args(args, shell, cmd_encoding), shell=shell, cwd=cwd, env=__convert_env(env, cmd_encoding),
+        stdin=stdin, stdout=stdout, stderr=stderr,
+        preexec_fn=__get_preexec_fn(new_group and six.PY2, max_memory, max_cpu_time), **group_options)
+
+    def kill():
+        try:
+            if new_group:
+                os.killpg(p.pid, signal.SIGKILL)
+            else:
+                p.kill()
+        except OSError:
+            pass  # already finished
+
+    if on_start is not None:
+        on_start(kill)
+
+    outputs = {}
+    readers = []
+    if capture:
+        def read(name, pipe):
+            outputs[name] = pipe.read()
+            pipe.close()
+
+        for name, pipe in [('stdout', p.stdout), ('stderr', p.stderr)]:
+            th = threading.Thread(target=read, args=(name, pipe))
+            th.daemon = True
+            th.start()
+            readers.append(th)
+
+    timed_out = []
+    timer = None
+    if timeout is not None:
+        def expire():
+            timed_out.append(True)
+            kill()
+
+        timer = threading.Timer(timeout, expire)
+        timer.start()
+
+    try:
+        rusage = __wait_with_rusage(p) if hasattr(os, 'wait4') else None
+        if rusage is None:
+            p.wait()
+        wall_time = default_timer() - t
+        for th in readers:
+            th.join()
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if rusage is None:
+        user_time = system_time = max_rss = None
+    else:
+        user_time, system_time = rusage.ru_utime, rusage.ru_stime
+        # ru_maxrss is in kilobytes except on OS X
+        max_rss = rusage.ru_maxrss * (1 if sys.platform == 'darwin' else 1024)
+
+    return CommandResult(p.returncode, outputs.get('stdout'), outputs.get('stderr'), wall_time, user_time,
+                         system_time, max_rss, bool(timed_out))
+
+
+#
+# Asyncio variants
+#
+# command_async is imported by each function, so importing this module does not load asyncio.
+def async_execute_command(args, shell=False, cwd=None, env=None, stdin=None, stdout=None, stderr=None,
+                          cmd_encoding='utf-8'):
+    """
+    Execute external command on the asyncio event loop (Python 3.5+)
+    The child process is killed when the coroutine is cancelled.
+    Parameters are the same as execute_command.
+    :return: coroutine returning return code
+    """
+    assert sys.version_info >= (3, 5), 'asyncio variants require Python 3.5+.'
+    from mog_commons.command_async import execute_process
+    return execute_process(
+        __convert_args(args, shell, cmd_encoding), shell, cwd, __convert_env(env, cmd_encoding), stdin, stdout, stderr)
+
+
+def async_capture_command(args, shell=False, cwd=None, env=None, stdin=None, cmd_encoding='utf-8'):
+    """
+    Execute external command on the asyncio event loop and capture output (Python 3.5+)
+    The child process is killed when the coroutine is cancelled.
+    Parameters are the same as capture_command.
+    :return: coroutine returning tuple of return code, stdout data and stderr data
+    """
+    assert sys.version_info >= (3, 5), 'asyncio variants require Python 3.5+.'
+    from mog_commons.command_async import capture_process
+    return capture_process(
+        __convert_args(args, shell, cmd_encoding), shell, cwd, __convert_env(env, cmd_encoding), stdin)
+
+
+def async_execute_command_with_pid(args, pid_file=None, shell=False, cwd=None, env=None,
+                                   stdin=None, stdout=None, stderr=None, cmd_encoding='utf-8'):
+    """
+    Execute external command on the asyncio event loop, writing its pid to the file while running (Python 3.5+)
+    The child process is killed when the coroutine is cancelled, and the pid file is removed in any case.
+    Parameters are the same as execute_command_with_pid.
+    :return: coroutine returning return code
+    """
+    if pid_file is None:
+        return async_execute_command(args, shell, cwd, env, stdin, stdout, stderr, cmd_encoding)
+    assert sys.version_info >= (3, 5), 'asyncio variants require Python 3.5+.'
+    from mog_commons.command_async import execute_process_with_pid
+    return execute_process_with_pid(
+        __convert_args(args, shell, cmd_encoding), pid_file, shell, cwd, __convert_env(env, cmd_encoding),
+        stdin, stdout, stderr)
+
+
+#
+# Parallel execution
+#
+def run_many(commands, max_workers=4, timeout=None, ordered=True, shell=False, cwd=None, env=None,
+             cmd_encoding='utf-8'):
+    """
+    Execute external commands in parallel and capture their output
+    At most max_workers subprocesses run at the same time, and the commands are read lazily while iterating results.
+    When the iteration stops early or a command raises an exception, the running commands are killed.
+    :param commands: iterable of command line arguments, each of which is the same as args of capture_command
+    :param max_workers: maximum number of the subprocesses running at the same time : int
+    :param timeout: seconds to wait for each command, or None to wait forever : float
+    :param ordered: True to yield results in the order of the commands, False to yield them as they complete : boolean
+    :param shell: True when using shell : boolean
+    :param cwd: working directory : string
+    :param env: environment variables : dict
+    :param cmd_encoding: command line encoding: string
+    :return: generator of tuple of return code, stdout data and stderr data if ordered is True,
+             otherwise generator of tuple of the index of the command and the result tuple.
+             Return code is -9 (SIGKILL) on POSIX when the command has been killed by the timeout,
+             as capture_command.
+    """
+    assert max_workers > 0, 'max_workers must be positive.'
+    assert timeout is None or timeout > 0, 'timeout must be positive.'
+
+    # environment variables are converted only once for all the commands
+    converted_env = __convert_env(env, cmd_encoding)
+    finished = queue.Queue()
+
+    # functions killing the running commands, indexed by the command index
+    killers = {}
+    lock = threading.Lock()
+    closed = []
+
+    def register(index, kill):
+        with lock:
+            if closed:
+                kill()
+            else:
+                killers[index] = kill
+
+    def work(index, args):
+        try:
+            r = __run_command(args, shell, cwd, converted_env, None, None, None, True, timeout, None, None,
+                              cmd_encoding, lambda kill: register(index, kill))
+            finished.put((index, (r.returncode, r.stdout, r.stderr), None))
+        except Exception:
+            finished.put((index, None, sys.exc_info()))
+        finally:
+            with lock:
+                killers.pop(index, None)
+
+    it = iter(commands)
+    num_started = 0
+    num_running = 0
+    exhausted = False
+    next_index = 0
+    done = {}
+
+    try:
+        while True:
+            while not exhausted and num_running < max_workers:
+                try:
+                    args = next(it)
+                except StopIteration:
+                    exhausted = True
+                    break
+                th = threading.Thread(target=work, args=(num_started, args))
+                th.daemon = True
+                th.start()
+                num_started += 1
+                num_running += 1
+
+            if num_running == 0:
+                break
+
+            index, result, exc_info = finished.get()
+            num_running -= 1
+
+            if not ordered:
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                yield index, result
+                continue
+
+            done[index] = (result, exc_info)
+            while next_index in done:
+                result, exc_info = done.pop(next_index)
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                yield result
+                next_index += 1
+    finally:
+        with lock:
+            closed.append(True)
+            for kill in killers.values():
+                kill()
+
+
+#
+# Streaming
+#
+def stream_command(args, shell=False, cwd=None, env=None, stdin=None, encoding_list=None, lines=False,
+                   chunk_size=65536, probe_size=4096, max_size=None, tail_size=0, queue_size=16,
+                   cmd_encoding='utf-8'):
+    """
+    Execute external command and read its output incrementally
+    The output is read by the background threads into the bounded queue. When the queue is full, the threads stop
+    reading and the command blocks on writing, so the memory usage does not depend on the size of the output.
+    :param args: command line arguments : [string]
+    :param shell: True when using shell : boolean
+    :param cwd: working directory : string
+    :param env: environment variables : dict
+    :param stdin: standard input
+    :param encoding_list: encodings to decode the output with fallback as unicode_decode_stream does,
+                          or None to get bytes : list[string] or string
+    :param lines: True to yield each line (including the line ending), False to yield chunks as they arrive : boolean
+    :param chunk_size: maximum number of bytes to read at once : int
+    :param probe_size: maximum number of bytes to try the encodings in parallel; the output is held back while
+                       more than one encoding survives, and is not delayed with a single encoding : int
+    :param max_size: maximum length of the data to yield for each stream, or None for no limit : int
+    :param tail_size: length of the data to keep from the end of the output beyond max_size, which is yielded
+                      at the end of the stream : int
+    :param queue_size: maximum number of the events to buffer : int
+    :param cmd_encoding: command line encoding: string
+    :return: CommandStream: iterable of tuple of the stream name ('stdout' or 'stderr') and the data
+    """
+    assert chunk_size > 0, 'chunk_size must be positive.'
+    assert max_size is None or max_size >= 0, 'max_size must not be negative.'
+    assert tail_size >= 0, 'tail_size must not be negative.'
+    assert queue_size > 0, 'queue_size must be positive.'
+
+    p = subprocess.Popen(
+        __convert_args(args, shell, cmd_encoding), shell=shell, cwd=cwd, env=__convert_env(env, cmd_encoding),
+        stdin=stdin, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return CommandStream(p, encoding_list, lines, chunk_size, probe_size, max_size, tail_size, queue_size)
+
+
+class CommandStream(object):
+    """
+    Output events of the running command created by stream_command
+
+    Iterate this only once to get tuples of the stream name and the data. When the iteration finishes, returncode
+    is set, and truncated holds the length of the data dropped by max_size for each stream.
+    The command is killed if the iteration stops in the middle.
+    """
+
+    def __init__(self, process, encoding_list, lines, chunk_size, probe_size, max_size, tail_size, queue_size):
+        self.process = process
+        self.returncode = None
+        self.truncated = {'stdout': 0, 'stderr': 0}
+
+        self._encoding_list = encoding_list
+        self._lines = lines
+        self._chunk_size = chunk_size
+        self._probe_size = probe_size
+        self._max_size = max_size
+        self._tail_size = tail_size
+        self._events = queue.Queue(queue_size)
+        self._closed = False
+
+        for name, pipe in [('stdout', process.stdout), ('stderr', process.stderr)]:
+            th = threading.Thread(target=self._read, args=(name, pipe))
+            th.daemon = True
+            th.start()
+
+    def __iter__(self):
+        num_open = 2
+        try:
+            while num_open:
+                name, data, exc_info = self._events.get()
+                if exc_info is not None:
+                    six.reraise(*exc_info)
+                if data is None:
+                    num_open -= 1
+                else:
+                    yield name, data
+            self.returncode = self.process.wait()
+        finally:
+            if num_open:
+                self.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """Kill the command if it is still running, and stop reading the output."""
+        self._closed = True
+        if self.process.poll() is None:
+            try:
+                self.process.kill()
+            except OSError:
+                pass  # already finished
+        self.returncode = self.process.wait()
+
+    def _put(self, event):
+        """Put the event to the queue, waiting for the consumer. Return false if closed."""
+        while not self._closed:
+            try:
+                self._events.put(event, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _read(self, name, pipe):
+        exc_info = None
+        try:
+            fd = pipe.fileno()
+            xs = iter(lambda: os.read(fd, self._chunk_size), b'')
+            if self._encoding_list:
+                xs = unicode_decode_stream(xs, self._encoding_list, probe_size=self._probe_size)
+            if self._lines:
+                xs = _iter_lines(xs)
+
+            if self._max_size is None:
+                for data in xs:
+                    if not self._put((name, data, None)):
+                        return
+            else:
+                for data in self._cap(name, xs):
+                    if not self._put((name, data, None)):
+                        return
+        except Exception:
+            exc_info = sys.exc_info()
+        finally:
+            pipe.close()
+        self._put((name, None, exc_info))
+
+    def _cap(self, name, xs):
+        """Yield the data up to max_size, then the last tail_size of the rest at the end."""
+        max_size, tail_size = self._max_size, self._tail_size
+        sent = 0
+        tail = deque()
+        tail_length = 0
+
+        for data in xs:
+            if sent < max_size:
+                if sent + len(data) <= max_size:
+                    sent += len(data)
+                    yield data
+                    continue
+                if not self._lines:
+                    yield data[:max_size - sent]
+                    data = data[max_size - sent:]
+                sent = max_size
+
+            tail.append(data)
+            tail_length += len(data)
+            while tail_length > tail_size:
+                excess = tail_length - tail_size
+                if self._lines or len(tail[0]) <= excess:
+                    # drop whole lines
+                    dropped = len(tail.popleft())
+                else:
+                    tail[0] = tail[0][excess:]
+                    dropped = excess
+                tail_length -= dropped
+                self.truncated[name] += dropped
+
+        if self._lines:
+            for data in tail:
+                yield data
+        elif tail:
+            yield tail[0][:0].join(tail)
+
+
+def _iter_lines(chunks):
+    """Split the chunks of bytes or unicode into lines including the line endings."""
+    pending = []
+    for chunk in chunks:
+        newline = b'\n' if isinstance(chunk, bytes) else '\n'
+        start = 0
+        while True:
+            i = chunk.find(newline, start)
+            if i < 0:
+                break
+            pending.append(chunk[start:i + 1])
+            yield chunk[:0].join(pending)
+            pending = []
+            start = i + 1
+        if start < len(chunk):
+            pending.append(chunk[start:])
+    if pending:
+        yield pending[0][:0].join(pending)
+
+
+#
+# Context
+#
+class CommandContext(CaseClass):
+    """
+    Working directory, environment variables and command line encoding shared by many commands
+
+    The environment variables are converted only once when the context is created.
+    Create a new context to reflect the changes of os.environ after that.
+
+    :example:
+            ctx = CommandContext(cwd='/tmp', env={'LANG': 'C'})
+            for path in paths:
+                ctx.capture_command(['wc', '-l', path])
+    """
+
+    def __init__(self, cwd=None, env=None, cmd_encoding='utf-8'):
+        CaseClass.__init__(self,
+                           ('cwd', cwd),
+                           ('env', prepare_env(env, cmd_encoding)),
+                           ('cmd_encoding', cmd_encoding)
+                           )
+
+    def __repr__(self):
+        # the environment variables may hold secrets, so only the number of them is shown
+        return 'CommandContext(cwd=%r, env=<%d variables>, cmd_encoding=%r)' % (
+            self.cwd, len(self.env), self.cmd_encoding)
+
+    def execute_command(self, args, shell=False, stdin=None, stdout=None, stderr=None, **kwargs):
+        return execute_command(args, shell, self.cwd, self.env, stdin, stdout, stderr, self.cmd_encoding, **kwargs)
+
+    def capture_command(self, args, shell=False, stdin=None, **kwargs):
+        return capture_command(args, shell, self.cwd, self.env, stdin, self.cmd_encoding, **kwargs)
+
+    def run_command(self, args, shell=False, stdin=None, stdout=None, stderr=None, capture=False, **kwargs):
+        return run_command(args, shell, self.cwd, self.env, stdin, stdout, stderr, capture,
+                           cmd_encoding=self.cmd_encoding, **kwargs)
+
+    def execute_command_with_pid(self, args, pid_file=None, shell=False, stdin=None, stdout=None, stderr=None):
+        return execute_command_with_pid(
+            args, pid_file, shell, self.cwd, self.env, stdin, stdout, stderr, self.cmd_encoding)
+
+    def run_many(self, commands, max_workers=4, timeout=None, ordered=True, shell=False):
+        return run_many(commands, max_workers, timeout, ordered, shell, self.cwd, self.env, self.cmd_encoding)
+
+    def stream_command(self, args, shell=False, stdin=None, **kwargs):
+        return stream_command(args, shell, self.cwd, self.env, stdin, cmd_encoding=self.cmd_encoding, **kwargs)
+
+
 @types(bool, pid=int)
 def pid_exists(pid):
     """
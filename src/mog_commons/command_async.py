@@ -0,0 +1,69 @@
+"""
+Coroutines running external commands on asyncio subprocesses
+
+The arguments and environment variables must be converted by the callers in mog_commons.command.
+This module requires Python 3.5+.
+"""
+
+import os
+import asyncio
+import subprocess
+
+
+async def __create_process(args, shell, cwd, env, stdin, stdout, stderr):
+    if shell:
+        if not isinstance(args, (str, bytes)):
+            args = args[0] if len(args) == 1 else subprocess.list2cmdline(args)
+        return await asyncio.create_subprocess_shell(
+            args, cwd=cwd, env=env, stdin=stdin, stdout=stdout, stderr=stderr)
+    else:
+        if isinstance(args, (str, bytes)):
+            args = [args]
+        return await asyncio.create_subprocess_exec(
+            *args, cwd=cwd, env=env, stdin=stdin, stdout=stdout, stderr=stderr)
+
+
+async def __wait_or_kill(process, awaitable):
+    """Await the process, and kill it when the waiting coroutine is cancelled or fails."""
+    try:
+        return await awaitable
+    except BaseException:
+        if process.returncode is None:
+            try:
+                process.kill()
+            except ProcessLookupError:
+                pass  # already finished
+            await process.wait()
+        raise
+
+
+async def execute_process(args, shell, cwd, env, stdin, stdout, stderr):
+    """
+    :return: return code
+    """
+    p = await __create_process(args, shell, cwd, env, stdin, stdout, stderr)
+    return await __wait_or_kill(p, p.wait())
+
+
+async def capture_process(args, shell, cwd, env, stdin):
+    """
+    :return: tuple of return code, stdout data and stderr data
+    """
+    p = await __create_process(args, shell, cwd, env, stdin, subprocess.PIPE, subprocess.PIPE)
+    stdout_data, stderr_data = await __wait_or_kill(p, p.communicate())
+    return p.returncode, stdout_data, stderr_data
+
+
+async def execute_process_with_pid(args, pid_file, shell, cwd, env, stdin, stdout, stderr):
+    """
+    :return: return code
+    """
+    try:
+        p = await __create_process(args, shell, cwd, env, stdin, stdout, stderr)
+        with open(pid_file, 'w') as f:
+            f.write(str(p.pid))
+        return await __wait_or_kill(p, p.wait())
+    finally:
+        # clean up pid file
+        if os.path.exists(pid_file):
+            os.remove(pid_file)
@@ -1,7 +1,7 @@
 from __future__ import division, print_function, absolute_import, unicode_literals
 
 import sys
-from mog_commons.string import is_unicode, to_bytes, to_unicode
+from mog_commons.string import is_unicode, to_bytes_unchecked, to_unicode_unchecked
 
 
 def print_safe(str_or_bytes, encoding='utf-8', errors='ignore', output=sys.stdout, newline='\n'):
@@ -16,8 +16,8 @@ def print_safe(str_or_bytes, encoding='utf-8', errors='ignore', output=sys.stdou
     writer = output.buffer if hasattr(output, 'buffer') else output
 
     # When the input type is bytes, verify it can be decoded with the specified encoding.
-    decoded = str_or_bytes if is_unicode(str_or_bytes) else to_unicode(str_or_bytes, encoding, errors)
-    encoded = to_bytes(decoded, encoding, errors)
+    decoded = str_or_bytes if is_unicode(str_or_bytes) else to_unicode_unchecked(str_or_bytes, encoding, errors)
+    encoded = to_bytes_unchecked(decoded, encoding, errors)
 
-    writer.write(encoded + to_bytes(newline, encoding, errors))
+    writer.write(encoded + to_bytes_unchecked(newline, encoding, errors))
     output.flush()
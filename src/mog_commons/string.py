@@ -1,66 +1,255 @@
+# -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import sys
+import re
+import codecs
+from array import array
+from bisect import bisect_left, bisect_right
 from unicodedata import east_asian_width
 import six
 
-from mog_commons.collection import distinct
+try:
+    from itertools import accumulate
+except ImportError:
+    def accumulate(xs):
+        total = 0
+        for x in xs:
+            total += x
+            yield total
+
+from mog_commons.collection import distinct, LRUCache
 from mog_commons.types import *
 
 __all__ = [
     'is_unicode',
     'is_strlike',
     'unicode_width',
+    'unicode_widths',
+    'max_unicode_width',
+    'set_width_cache_size',
+    'width_cache_info',
     'to_unicode',
     'to_str',
     'to_bytes',
+    'to_unicode_unchecked',
+    'to_str_unchecked',
+    'to_bytes_unchecked',
+    'to_unicode_many',
+    'to_bytes_many',
     'edge_just',
     'unicode_ljust',
     'unicode_rjust',
+    'format_table',
+    'iter_table_rows',
     'unicode_right',
     'unicode_left',
+    'WidthIndex',
     'unicode_decode',
+    'unicode_decode_stream',
+    'detect_encoding',
 ]
 
 __unicode_width_mapping = {'F': 2, 'H': 1, 'W': 2, 'Na': 1, 'A': 2, 'N': 1}
 
+# table of the character widths indexed by code point; '\x01' for narrow and '\x02' for wide
+__unicode_width_table = None
+
+if hasattr(str, 'isascii'):
+    __is_ascii = lambda s: s.isascii()
+else:
+    __is_ascii = lambda s, patterns=(re.compile('[^\x00-\x7f]'), re.compile(b'[^\x00-\x7f]')): \
+        patterns[not is_unicode(s)].search(s) is None
+
+
+def __get_width_table():
+    """Build the width table at first use. This takes a fraction of a second."""
+    global __unicode_width_table
+
+    if __unicode_width_table is None:
+        m = dict((k, six.unichr(v)) for k, v in __unicode_width_mapping.items())
+        __unicode_width_table = ''.join(
+            m[east_asian_width(six.unichr(i))] for i in range(sys.maxunicode + 1))
+    return __unicode_width_table
+
+
+def __to_widths(s):
+    """Translate each character to '\x01' (narrow) or '\x02' (wide)."""
+    return s.translate(__get_width_table())
+
+
+def __left_length(widths, width):
+    """Find the longest prefix length whose width fits; binary search on the wide-char counts."""
+    lo, hi = 0, min(len(widths), max(width, 0))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if mid + widths.count('\x02', 0, mid) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def __right_length(widths, width):
+    """Find the longest suffix length whose width fits."""
+    n = len(widths)
+    lo, hi = 0, min(n, max(width, 0))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if mid + widths.count('\x02', n - mid) <= width:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
 
 def is_unicode(s):
     return (six.PY2 and isinstance(s, unicode)) or (six.PY3 and isinstance(s, str))
 
 
 def is_strlike(s):
-    return isinstance(s, (six.string_types, bytes))
+    return isinstance(s, String)
+
+
+def __from_buffer(s):
+    """Copy bytearray and memoryview into bytes, which can be hashed and concatenated."""
+    return __to_bytes_from_buffer(s) if isinstance(s, Buffer) else s
+
+
+#
+# Width cache
+#
+__width_cache = None
+
+# short ASCII strings are faster to compute than to look up the cache
+__WIDTH_CACHE_MIN_LENGTH = 32
+
+
+def set_width_cache_size(maxsize):
+    """
+    Enable the cache of the results of unicode_width, edge_just, unicode_ljust and unicode_rjust.
+    Least recently used results are discarded. ASCII strings for unicode_width and short ASCII strings for the
+    justification functions bypass the cache.
+    :param maxsize: maximum number of the results to keep; 0 disables the cache
+    """
+    global __width_cache
+
+    assert maxsize >= 0, 'maxsize must not be negative.'
+    __width_cache = LRUCache(maxsize) if maxsize else None
+
+
+def width_cache_info():
+    """
+    :return: dict of hits, misses, maxsize and size of the width cache, or None if the cache is disabled
+    """
+    return None if __width_cache is None else __width_cache.info()
 
 
 @types(s=String)
 def unicode_width(s):
     if is_unicode(s):
-        return sum(__unicode_width_mapping[east_asian_width(c)] for c in s)
+        if __is_ascii(s):
+            return len(s)
+
+        cache = __width_cache
+        if cache is None:
+            return len(s) + __to_widths(s).count('\x02')
+
+        ret = cache.get(s)
+        if ret is None:
+            ret = len(s) + __to_widths(s).count('\x02')
+            cache.put(s, ret)
+        return ret
 
     assert is_strlike(s), 's must be a string, not %s.' % type(s).__name__
     return len(s)
 
 
+# NumPy is used only for large inputs because of the overhead of building arrays
+__NUMPY_MIN_LENGTH = 4096
+
+# NumPy module imported at the first large input; False if unavailable
+__numpy = None
+
+
+def __get_numpy():
+    global __numpy
+
+    if __numpy is None:
+        try:
+            import numpy
+            __numpy = numpy
+        except ImportError:
+            __numpy = False
+    return __numpy
+
+
+def __count_wide(widths, strings):
+    ret = []
+    pos = 0
+    for s in strings:
+        n = pos + len(s)
+        ret.append(widths.count('\x02', pos, n))
+        pos = n
+    return ret
+
+
+def __count_wide_numpy(numpy, widths, strings):
+    cumulative = numpy.zeros(len(widths) + 1, dtype=numpy.int64)
+    numpy.cumsum(numpy.frombuffer(widths.encode('latin-1'), dtype=numpy.uint8) - 1, out=cumulative[1:])
+    offsets = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+    numpy.cumsum([len(s) for s in strings], out=offsets[1:])
+    return (cumulative[offsets[1:]] - cumulative[offsets[:-1]]).tolist()
+
+
+def unicode_widths(strings):
+    """
+    Compute the widths of many strings in one call.
+    Unicode strings are joined and translated through the width table at once. NumPy is used if available.
+    :param strings: iterable of strings
+    :return: list of int: widths
+    """
+    xs = list(strings)
+    ret = [len(x) for x in xs]
+
+    indices = [i for i, x in enumerate(xs) if isinstance(x, Unicode)]
+    us = xs if len(indices) == len(xs) else [xs[i] for i in indices]
+    joined = ''.join(us)
+    if __is_ascii(joined):
+        return ret
+
+    widths = __to_widths(joined)
+    numpy = __get_numpy() if len(joined) >= __NUMPY_MIN_LENGTH else None
+    if numpy:
+        counts = __count_wide_numpy(numpy, widths, us)
+    else:
+        counts = __count_wide(widths, us)
+
+    for i, c in zip(indices, counts):
+        ret[i] += c
+    return ret
+
+
+def max_unicode_width(strings):
+    """
+    Compute the maximum width of the strings. Useful for sizing a column.
+    :param strings: iterable of strings
+    :return: int: maximum width, or 0 if empty
+    """
+    return max([0] + unicode_widths(strings))
+
+
 @types(encoding=Option(String), errors=String)
 def to_unicode(s, encoding=None, errors='strict'):
     """
     Make unicode string from any value
+    bytearray and memoryview are decoded directly without copying.
     :param s:
     :param encoding:
     :param errors:
     :return: unicode
     """
-    encoding = encoding or 'utf-8'
-
-    if is_unicode(s):
-        return s
-    elif is_strlike(s):
-        return s.decode(encoding, errors)
-    else:
-        if six.PY2:
-            return str(s).decode(encoding, errors)
-        else:
-            return str(s)
+    return to_unicode_unchecked(s, encoding, errors)
 
 
 @types(encoding=Option(String), errors=String)
@@ -72,31 +261,174 @@ def to_str(s, encoding=None, errors='strict'):
     :param errors:
     :return: str (not unicode in Python2, nor bytes in Python3)
     """
-    encoding = encoding or 'utf-8'
+    return to_str_unchecked(s, encoding, errors)
+
+
+@types(encoding=Option(String), errors=String)
+def to_bytes(s, encoding=None, errors='strict'):
+    """Convert string to bytes. bytearray and memoryview are copied into bytes."""
+    return to_bytes_unchecked(s, encoding, errors)
+
+
+#
+# Unchecked conversions for hot loops
+#
+__codecs = {}
+
+
+def __lookup_codec(encoding):
+    """
+    Resolve the codec only once per encoding name.
+    Like str.encode and bytes.decode, only text encodings are accepted.
+    """
+    codec = __codecs.get(encoding)
+    if codec is None:
+        codec = codecs.lookup(encoding)
+        if not getattr(codec, '_is_text_encoding', True):
+            raise LookupError("'%s' is not a text encoding" % encoding)
+        __codecs[encoding] = codec
+    return codec
+
+
+def __encode(s, encoding, errors):
+    # str.encode has its own fast path and rejects non-text encodings
+    return s.encode(encoding or 'utf-8', errors)
+
+
+def __decode(s, encoding, errors):
+    if isinstance(s, (bytes, bytearray)):
+        return s.decode(encoding or 'utf-8', errors)
+    # memoryview does not have the decode method
+    return __lookup_codec(encoding or 'utf-8').decode(s, errors)[0]
+
+
+def __to_bytes_from_buffer(s):
+    if isinstance(s, bytes):
+        return s
+    # bytes is immutable, so we have to copy the buffer here
+    return bytes(s) if isinstance(s, bytearray) else s.tobytes()
+
+
+def to_unicode_unchecked(s, encoding=None, errors='strict'):
+    """Same as to_unicode but without argument type checks. Use this in hot loops."""
+    t = type(s)
+    if t is Unicode:
+        return s
+    if t is bytes:
+        return __decode(s, encoding, errors)
+
+    if is_unicode(s):
+        return s
+    elif is_strlike(s):
+        return __decode(s, encoding, errors)
+    else:
+        if six.PY2:
+            return __decode(str(s), encoding, errors)
+        else:
+            return str(s)
+
+
+def to_str_unchecked(s, encoding=None, errors='strict'):
+    """Same as to_str but without argument type checks. Use this in hot loops."""
+    t = type(s)
+    if t is str:
+        return s
 
     if is_strlike(s):
         if six.PY2:
-            return s.encode(encoding, errors) if isinstance(s, unicode) else s
+            return __encode(s, encoding, errors) if isinstance(s, unicode) else __to_bytes_from_buffer(s)
         else:
-            return s.decode(encoding, errors) if isinstance(s, bytes) else s
+            return s if isinstance(s, str) else __decode(s, encoding, errors)
     else:
         return str(s)
 
 
-@types(encoding=Option(String), errors=String)
-def to_bytes(s, encoding=None, errors='strict'):
-    """Convert string to bytes."""
-    encoding = encoding or 'utf-8'
+def to_bytes_unchecked(s, encoding=None, errors='strict'):
+    """Same as to_bytes but without argument type checks. Use this in hot loops."""
+    t = type(s)
+    if t is bytes:
+        return s
+    if t is Unicode:
+        return __encode(s, encoding, errors)
 
     if is_unicode(s):
-        return s.encode(encoding, errors)
+        return __encode(s, encoding, errors)
     elif is_strlike(s):
-        return s
+        return __to_bytes_from_buffer(s)
     else:
         if six.PY2:
             return str(s)
         else:
-            return str(s).encode(encoding, errors)
+            return __encode(str(s), encoding, errors)
+
+
+#
+# Batch conversions
+#
+def __unicode_converter(encoding, errors):
+    """Build a function converting a value to unicode."""
+    encoding = encoding or 'utf-8'
+    decode = lambda s: s.decode(encoding, errors)
+
+    def f(s):
+        t = type(s)
+        if t is Unicode:
+            return s
+        if t is bytes:
+            return decode(s)
+        return to_unicode_unchecked(s, encoding, errors)
+
+    return f
+
+
+def __bytes_converter(encoding, errors):
+    """Build a function converting a value to bytes."""
+    encoding = encoding or 'utf-8'
+    encode = lambda s: s.encode(encoding, errors)
+
+    def f(s):
+        t = type(s)
+        if t is bytes:
+            return s
+        if t is Unicode:
+            return encode(s)
+        return to_bytes_unchecked(s, encoding, errors)
+
+    return f
+
+
+@types(encoding=Option(String), errors=String, sep=Option(String), lazy=bool)
+def to_unicode_many(iterable, encoding=None, errors='strict', sep=None, lazy=False):
+    """
+    Make unicode strings from many values, as to_unicode does for each value
+    :param iterable: values to convert
+    :param encoding: encoding
+    :param errors: error handling scheme
+    :param sep: if given, join the results with this separator into one string
+    :param lazy: if true, return an iterator which converts the values on demand (ignored when sep is given)
+    :return: list of unicode, iterator of unicode or unicode
+    """
+    converted = six.moves.map(__unicode_converter(encoding, errors), iterable)
+    if sep is not None:
+        return to_unicode_unchecked(sep, encoding, errors).join(converted)
+    return converted if lazy else list(converted)
+
+
+@types(encoding=Option(String), errors=String, sep=Option(String), lazy=bool)
+def to_bytes_many(iterable, encoding=None, errors='strict', sep=None, lazy=False):
+    """
+    Convert many values to bytes, as to_bytes does for each value
+    :param iterable: values to convert
+    :param encoding: encoding
+    :param errors: error handling scheme
+    :param sep: if given, join the results with this separator into one bytes. e.g. b'\\n'
+    :param lazy: if true, return an iterator which converts the values on demand (ignored when sep is given)
+    :return: list of bytes, iterator of bytes or bytes
+    """
+    converted = six.moves.map(__bytes_converter(encoding, errors), iterable)
+    if sep is not None:
+        return to_bytes_unchecked(sep, encoding, errors).join(converted)
+    return converted if lazy else list(converted)
 
 
 @types(left=String, right=String, width=int, fillchar=String, min_padding_length=int)
@@ -109,6 +441,20 @@ def edge_just(left, right, width, fillchar=' ', min_padding_length=1):
     :param min_padding_length: minimum padding length
     :return:
     """
+    left, right = __from_buffer(left), __from_buffer(right)
+    cache = __width_cache
+    if cache is None or (len(left) + len(right) < __WIDTH_CACHE_MIN_LENGTH and __is_ascii(left + right)):
+        return __edge_just(left, right, width, fillchar, min_padding_length)
+
+    key = (type(left), type(right), left, right, width, fillchar, min_padding_length)
+    ret = cache.get(key)
+    if ret is None:
+        ret = __edge_just(left, right, width, fillchar, min_padding_length)
+        cache.put(key, ret)
+    return ret
+
+
+def __edge_just(left, right, width, fillchar, min_padding_length):
     assert unicode_width(fillchar) == 1, 'fillchar must be single-width char'
     padding = fillchar * max(min_padding_length, width - unicode_width(left + right))
     return left + padding + right
@@ -134,46 +480,369 @@ def unicode_rjust(s, width, fillchar=' '):
 
 @types(s=String, width=int)
 def unicode_left(s, width):
-    """Cut unicode string from left to fit a given width."""
-    i = 0
-    j = 0
-    for ch in s:
-        j += __unicode_width_mapping[east_asian_width(ch)]
-        if width < j:
-            break
-        i += 1
-    return s[:i]
+    """Cut unicode string from left to fit a given width. Byte strings are cut as one column per byte."""
+    s = __from_buffer(s)
+    if not is_unicode(s) or __is_ascii(s):
+        return s[:max(width, 0)]
+    # every character takes at least one column, so the rest of the string does not matter
+    head = s[:max(width, 0)]
+    return head[:__left_length(__to_widths(head), width)]
 
 
 @types(s=String, width=int)
 def unicode_right(s, width):
-    """Cut unicode string from right to fit a given width."""
-    i = len(s)
-    j = 0
-    for ch in reversed(s):
-        j += __unicode_width_mapping[east_asian_width(ch)]
-        if width < j:
-            break
-        i -= 1
-    return s[i:]
+    """Cut unicode string from right to fit a given width. Byte strings are cut as one column per byte."""
+    s = __from_buffer(s)
+    if not is_unicode(s) or __is_ascii(s):
+        return s[len(s) - max(min(width, len(s)), 0):]
+    tail = s[len(s) - max(min(width, len(s)), 0):]
+    return tail[len(tail) - __right_length(__to_widths(tail), width):]
+
+
+#
+# Tables
+#
+# rows are not checked item by item, which would take as long as formatting a small table
+@types(rows=list, aligns=Option(ListOf(String)), max_widths=Option(ListOf(Option(int))), sep=String, newline=String)
+def format_table(rows, aligns=None, max_widths=None, sep=' ', newline='\n'):
+    """
+    Format rows of cells into a table whose columns are aligned by the print-length width.
+    The width of each cell is computed only once, and the whole table is built with one join.
+    :param rows: list[list or tuple]: rows of cells; non-string cells are converted by to_unicode
+    :param aligns: list[string]: 'l' (left-justified) or 'r' (right-justified) for each column; default is 'l'
+    :param max_widths: list[int or None]: maximum width of each column; overflowing cells are cut by unicode_left
+                       when left-justified, or unicode_right when right-justified
+    :param sep: string: column separator
+    :param newline: string: line separator, which is appended to every line
+    :return: string: formatted table
+    """
+    cells = [to_unicode_many(row) for row in rows]
+    num_columns = max([0] + [len(row) for row in cells])
+    aligns = __complete_aligns(aligns, num_columns)
+
+    # compute all the widths at once
+    flat_widths = unicode_widths(c for row in cells for c in row)
+    cell_widths = []
+    column_widths = [0] * num_columns
+    pos = 0
+    for row in cells:
+        ws = flat_widths[pos:pos + len(row)]
+        pos += len(ws)
+        cell_widths.append(ws)
+        for j, w in enumerate(ws):
+            if column_widths[j] < w:
+                column_widths[j] = w
+
+    if max_widths:
+        for j, w in enumerate(max_widths[:num_columns]):
+            if w is not None and w < column_widths[j]:
+                column_widths[j] = max(w, 0)
+
+    parts = []
+    for row, ws in zip(cells, cell_widths):
+        __format_row(parts, row, ws, column_widths, aligns, sep)
+        parts.append(newline)
+    return ''.join(parts)
+
+
+@types(widths=ListOf(int), aligns=Option(ListOf(String)), sep=String)
+def iter_table_rows(rows, widths, aligns=None, sep=' '):
+    """
+    Format rows lazily with the fixed column widths, e.g. for streaming rows as they arrive.
+    :param rows: iterable of list: rows of cells; non-string cells are converted by to_unicode
+    :param widths: list[int]: width of each column; overflowing cells are cut as format_table does
+    :param aligns: list[string]: 'l' (left-justified) or 'r' (right-justified) for each column; default is 'l'
+    :param sep: string: column separator
+    :return: generator of string: formatted lines without newlines
+    """
+    aligns = __complete_aligns(aligns, len(widths))
+    for row in rows:
+        cells = to_unicode_many(row[:len(widths)])
+        parts = []
+        __format_row(parts, cells, unicode_widths(cells), widths, aligns, sep)
+        yield ''.join(parts)
+
+
+def __complete_aligns(aligns, num_columns):
+    aligns = list(aligns or [])
+    for a in aligns:
+        assert a in ('l', 'r'), 'align must be l or r, not %s.' % a
+    return aligns[:num_columns] + ['l'] * (num_columns - len(aligns))
+
+
+def __format_row(parts, cells, cell_widths, column_widths, aligns, sep):
+    """Append the parts of the formatted row."""
+    for j, (cell, w) in enumerate(zip(cells, cell_widths)):
+        if j:
+            parts.append(sep)
+        width = column_widths[j]
+        if width < w:
+            cell = unicode_left(cell, width) if aligns[j] == 'l' else unicode_right(cell, width)
+            w = unicode_width(cell)
+        if aligns[j] == 'l':
+            parts.append(cell)
+            parts.append(' ' * (width - w))
+        else:
+            parts.append(' ' * (width - w))
+            parts.append(cell)
+    for j in range(len(cells), len(column_widths)):
+        if j:
+            parts.append(sep)
+        parts.append(' ' * column_widths[j])
+
+
+def _cumulative_widths(s):
+    """
+    :return: array of int: the i-th element is the width of s[:i]
+    """
+    # array takes a native str as the type code in Python 2
+    ret = array(str('l'), [0])
+    if __is_ascii(s):
+        ret.extend(range(1, len(s) + 1))
+    else:
+        ret.extend(accumulate(bytearray(__to_widths(s).encode('latin-1'))))
+    return ret
+
+
+class WidthIndex(object):
+    """
+    Index of the cumulative widths of a unicode string
+
+    Building the index is O(n), then each query is answered in O(log n).
+    This is useful for cutting the same long string to different widths repeatedly.
+    For a one-off cut, unicode_left and unicode_right are faster.
+
+    Example:
+        index = WidthIndex('あいうabc')
+        index.width  # 9
+        index.left(5)  # 'あい'
+        index.right(4)  # 'abc'
+        index.slice_by_columns(2, 7)  # 'いうa'
+        index.column_of(3)  # 6
+    """
+
+    def __init__(self, s):
+        self.s = s
+        self.prefix = _cumulative_widths(s)
+
+    @property
+    def width(self):
+        return self.prefix[-1]
+
+    def left(self, width):
+        """Cut the string from left to fit a given width. Same as unicode_left."""
+        return self.s[:max(0, bisect_right(self.prefix, width) - 1)]
+
+    def right(self, width):
+        """Cut the string from right to fit a given width. Same as unicode_right."""
+        return self.s[bisect_left(self.prefix, self.width - max(width, 0)):]
+
+    def slice_by_columns(self, start, stop):
+        """
+        Get the characters which fit entirely in the columns [start, stop).
+        :param start: int: start column (inclusive)
+        :param stop: int: stop column (exclusive)
+        """
+        i = bisect_left(self.prefix, start)
+        j = bisect_right(self.prefix, stop) - 1
+        return self.s[i:max(i, j)]
+
+    def column_of(self, index):
+        """
+        :param index: int: character index
+        :return: int: the column where the character starts
+        """
+        return self.prefix[index]
 
 
 @types(encoding_list=(String, ListOf(String)))
 def unicode_decode(data, encoding_list):
     """
     Decode string data with one or more encodings, trying sequentially
-    :param data: bytes: encoded string data
+    The encodings which fail on the head of the data are skipped without decoding the whole data.
+    :param data: bytes, bytearray or memoryview: encoded string data
     :param encoding_list: list[string] or string: encoding names
     :return: string: decoded string
     """
     assert encoding_list, 'encodings must not be empty.'
 
     xs = distinct(encoding_list if isinstance(encoding_list, list) else [encoding_list])
+
+    # for large data, try the first encoding which survives on the sample first;
+    # the encodings before that fail on the whole data as well
+    detected = detect_encoding(data, xs, use_bom=False) if len(xs) > 1 and len(data) > 65536 else None
+    if detected is not None and detected != xs[0]:
+        try:
+            return __decode(data, detected, 'strict')
+        except UnicodeDecodeError:
+            pass
+
     first_exp = None
     for i, encoding in enumerate(xs):
+        if encoding == detected and i != 0:
+            continue
         try:
-            return data.decode(encoding)
+            return __decode(data, encoding, 'strict')
         except UnicodeDecodeError as e:
             if i == 0:
                 first_exp = e
     raise first_exp
+
+
+__BOMS = [
+    (codecs.BOM_UTF32_LE, ('utf-32', 'utf-32-le')),
+    (codecs.BOM_UTF32_BE, ('utf-32', 'utf-32-be')),
+    (codecs.BOM_UTF8, ('utf-8-sig', 'utf-8')),
+    (codecs.BOM_UTF16_LE, ('utf-16', 'utf-16-le')),
+    (codecs.BOM_UTF16_BE, ('utf-16', 'utf-16-be')),
+]
+
+if six.PY2:
+    # re does not accept memoryview in Python 2
+    __is_ascii_buffer = lambda s, pattern=re.compile(b'[^\x00-\x7f]'): pattern.search(s.tobytes()) is None
+else:
+    __is_ascii_buffer = lambda s, pattern=re.compile(b'[^\x00-\x7f]'): pattern.search(s) is None
+
+# cache of whether each encoding decodes ASCII bytes as they are
+__ascii_compatible = {}
+
+
+def __is_ascii_compatible(encoding):
+    ret = __ascii_compatible.get(encoding)
+    if ret is None:
+        s = ''.join(six.unichr(i) for i in range(128))
+        try:
+            ret = s.encode('ascii').decode(encoding) == s
+        except (UnicodeDecodeError, LookupError):
+            ret = False
+        __ascii_compatible[encoding] = ret
+    return ret
+
+
+@types(candidates=ListOf(String), sample_bytes=int, use_bom=bool)
+def detect_encoding(data, candidates, sample_bytes=65536, use_bom=True):
+    """
+    Guess the encoding of the data from the head of it
+    :param data: bytes, bytearray or memoryview: encoded string data
+    :param candidates: list[string]: encoding names in order of preference
+    :param sample_bytes: int: number of bytes to examine
+    :param use_bom: bool: if true, the encoding indicated by the byte order mark is preferred when it is a candidate
+    :return: string: the first candidate which decodes the sample without errors, or None if nothing does
+    """
+    assert sample_bytes > 0, 'sample_bytes must be positive.'
+
+    sample = data[:sample_bytes]
+    final = len(sample) == len(data)
+
+    if use_bom:
+        names = dict((codecs.lookup(c).name, c) for c in reversed(candidates))
+        for bom, encodings in __BOMS:
+            if sample[:len(bom)] == bom:
+                for e in encodings:
+                    if e in names:
+                        return names[e]
+                break
+
+    is_ascii = __is_ascii(sample) if isinstance(sample, (bytes, bytearray)) else __is_ascii_buffer(sample)
+    for encoding in candidates:
+        if is_ascii and __is_ascii_compatible(encoding):
+            return encoding
+        try:
+            __decode(sample, encoding, 'strict')
+            return encoding
+        except UnicodeDecodeError as e:
+            # the sample may end in the middle of a character, or of a long sequence such as a UTF-7 shift
+            if not final and __decodes_partially(sample, encoding):
+                return encoding
+    return None
+
+
+def __decodes_partially(sample, encoding):
+    """Return true if the sample is valid except the incomplete sequence at the end."""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, False)
+        return True
+    except UnicodeDecodeError:
+        return False
+    except UnicodeError:
+        # the incremental decoder can be stricter than the one-shot decoder; e.g. UTF-16 without BOM
+        return True
+
+
+@types(encoding_list=(String, ListOf(String)), chunk_size=int, probe_size=int)
+def unicode_decode_stream(source, encoding_list, chunk_size=65536, probe_size=65536):
+    """
+    Decode a stream of encoded data with one or more encodings, yielding the decoded strings lazily
+
+    All the encodings are tried in parallel on the first chunks up to probe_size bytes, then the first encoding
+    in the list which survived is used for the rest of the stream. Probing stops as soon as only one encoding
+    survives, so a single encoding yields the decoded strings as the chunks arrive. Only the decoded strings of
+    the probed chunks are kept in memory.
+    :param source: file object opened in binary mode, or iterable of bytes
+    :param encoding_list: list[string] or string: encoding names
+    :param chunk_size: int: number of bytes to read at once from the file object
+    :param probe_size: int: number of bytes to try all the encodings
+    :return: generator of string: decoded strings
+    :raise UnicodeDecodeError: if all the encodings fail within probe_size bytes, the error of the first encoding
+                               is raised; if the chosen encoding fails after that, the error is raised at that point
+    """
+    assert encoding_list, 'encodings must not be empty.'
+    assert chunk_size > 0, 'chunk_size must be positive.'
+
+    xs = distinct(encoding_list if isinstance(encoding_list, list) else [encoding_list])
+    chunks = iter(lambda: source.read(chunk_size), b'') if hasattr(source, 'read') else iter(source)
+
+    # probe the encodings in parallel while more than one survives
+    candidates = [(encoding, codecs.getincrementaldecoder(encoding)(), []) for encoding in xs]
+    errors = []
+    probed = 0
+    eof = False
+    while len(candidates) > 1 and probed < probe_size:
+        chunk = next(chunks, None)
+        if chunk is None:
+            eof = True
+            break
+        probed += len(chunk)
+        candidates = __feed_decoders(candidates, chunk, False, xs[0], errors)
+
+    if eof:
+        candidates = __feed_decoders(candidates, b'', True, xs[0], errors)
+
+    # commit to the first survivor
+    encoding, decoder, buffered = candidates[0]
+    for text in buffered:
+        if text:
+            yield text
+    if eof:
+        return
+
+    del candidates, buffered
+    try:
+        for chunk in chunks:
+            text = decoder.decode(chunk)
+            probed += len(chunk)
+            if text:
+                yield text
+        text = decoder.decode(b'', True)
+    except UnicodeDecodeError:
+        # the last survivor failed within probe_size bytes as well as the others
+        if errors and probed < probe_size:
+            raise errors[0]
+        raise
+    if text:
+        yield text
+
+
+def __feed_decoders(candidates, chunk, final, first_encoding, errors):
+    """Feed the chunk to all the decoders and return the survivors. Raise the first encoding's error if none left."""
+    survivors = []
+    for encoding, decoder, buffered in candidates:
+        try:
+            buffered.append(decoder.decode(chunk, final))
+            survivors.append((encoding, decoder, buffered))
+        except UnicodeDecodeError as e:
+            if encoding == first_encoding:
+                errors.append(e)
+    if not survivors:
+        raise errors[0]
+    return survivors
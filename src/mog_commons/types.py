@@ -1,17 +1,28 @@
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import os
 import sys
+import random
+import warnings
+import weakref
+from itertools import islice
+from timeit import default_timer
 import six
 from abc import ABCMeta, abstractmethod
+from mog_commons.collection import LRUCache
+from mog_commons.callargs import get_argspec, getcallargs
 
-if sys.version_info < (2, 7):
-    from mog_commons.backported.inspect2 import getcallargs
+# native async wrappers require Python 3.6+ for async generators
+if sys.version_info >= (3, 6):
+    from inspect import iscoroutinefunction, isasyncgenfunction
+    from mog_commons.types_async import wrap_coroutine_function, wrap_async_generator_function
 else:
-    from inspect import getcallargs
+    iscoroutinefunction = isasyncgenfunction = lambda func: False
 
 __all__ = [
     'String',
     'Unicode',
+    'Buffer',
     'Option',
     'ListOf',
     'TupleOf',
@@ -20,20 +31,84 @@ __all__ = [
     'VarArg',
     'KwArg',
     'types',
+    'TypeCheckError',
+    'validate_many',
+    'iter_validated',
 ]
 
 #
 # Type definitions
 #
-String = six.string_types + (bytes,)
+# buffer-protocol objects holding encoded strings, e.g. slices of socket buffers
+Buffer = (bytearray, memoryview) if sys.version_info >= (2, 7) else (bytearray,)
+
+String = six.string_types + (bytes,) + Buffer
 
 Unicode = unicode if six.PY2 else str
 
 
+#
+# Element check strategies for containers
+#
+#   'all'      : check every element (default) -- the container is fully verified
+#   'first:N'  : check only the first N elements in the iteration order -- cost is O(N)
+#   'random:N' : check N elements chosen at random on every call -- a wrong element is caught probabilistically
+#                (O(N) for lists and tuples; sets and dicts still need to skip over the elements)
+#   'none'     : check only the container type -- no guarantee for the elements
+#
+CHECK_ALL, CHECK_FIRST, CHECK_RANDOM, CHECK_NONE = 'all', 'first', 'random', 'none'
+
+
+def _parse_check_strategy(check):
+    """
+    :param check: string: check strategy
+    :return: tuple of strategy name and the number of the elements
+    """
+    strategy, sep, count = check.partition(':')
+    if strategy in (CHECK_FIRST, CHECK_RANDOM):
+        assert count.isdigit() and int(count) > 0, 'Invalid check strategy: %s' % check
+        return strategy, int(count)
+    assert strategy in (CHECK_ALL, CHECK_NONE) and not sep, 'Invalid check strategy: %s' % check
+    return strategy, None
+
+
+def _compile_selector(strategy, count):
+    """
+    Build a function which picks the elements to check.
+    :return: function: (iterable, size) -> iterable, or None when all the elements should be checked
+    """
+    if strategy == CHECK_ALL:
+        return None
+    if strategy == CHECK_NONE:
+        return lambda xs, size: ()
+    if strategy == CHECK_FIRST:
+        return lambda xs, size: islice(xs, count)
+
+    def select_random(xs, size):
+        if size <= count:
+            return xs
+        indices = sorted(random.sample(range(size), count))
+        if isinstance(xs, (list, tuple)):
+            return [xs[i] for i in indices]
+        return _pick(iter(xs), indices)
+
+    return select_random
+
+
+def _pick(iterator, indices):
+    """Yield the elements at the sorted indices, skipping the others at C speed."""
+    prev = -1
+    for i in indices:
+        yield next(islice(iterator, i - prev - 1, None))
+        prev = i
+
+
 @six.add_metaclass(ABCMeta)
 class ComposableType(object):
     """Label for composable types"""
 
+    _checker = None
+
     @abstractmethod
     def name(self):
         """abstract method"""
@@ -42,54 +117,163 @@ class ComposableType(object):
     def check(self, obj):
         """abstract method"""
 
+    def compile(self):
+        """
+        Build a specialized checker function for this type.
+        Subclasses should override this to avoid dispatching on the nested type specs at every check.
+        :return: function: obj -> bool
+        """
+        return self.check
+
+    def checker(self):
+        """Return the specialized checker function, which is built only once and cached on this object."""
+        if self._checker is None:
+            self._checker = self.compile()
+        return self._checker
+
+    def is_immutable(self):
+        """
+        Return true if the result of the check never changes for the same object.
+        Then the result can be cached by the object identity.
+        """
+        return False
+
+    def find_mismatch(self, obj):
+        """
+        Find the innermost element which does not match this type. This is used only for error reporting.
+        :param obj: object which does not match this type
+        :return: tuple of (list of path strings, type spec, element), or None if there are no details
+        """
+        return None
+
 
 @six.add_metaclass(ABCMeta)
 class IterableOf(ComposableType):
-    def __init__(self, iterable_type, elem_type):
+    def __init__(self, iterable_type, elem_type, check=CHECK_ALL):
         self.iterable_type = iterable_type
         self.elem_type = elem_type
+        self.check_strategy = _parse_check_strategy(check)
 
     def name(self):
         return '%s(%s)' % (self.iterable_type.__name__, _get_name(self.elem_type))
 
     def check(self, obj):
-        return isinstance(obj, self.iterable_type) and all(_check_type(elem, self.elem_type) for elem in obj)
+        return self.checker()(obj)
+
+    def compile(self):
+        iterable_type = self.iterable_type
+        plain, composite = _split_type(self.elem_type)
+        select = _compile_selector(*self.check_strategy)
+
+        if not composite:
+            def f(obj):
+                if not isinstance(obj, iterable_type):
+                    return False
+                for elem in (obj if select is None else select(obj, len(obj))):
+                    if not isinstance(elem, plain):
+                        return False
+                return True
+        else:
+            check_elem = _compile_checker(self.elem_type)
+
+            def f(obj):
+                if not isinstance(obj, iterable_type):
+                    return False
+                for elem in (obj if select is None else select(obj, len(obj))):
+                    if not check_elem(elem):
+                        return False
+                return True
+        return _with_result_cache(self, f) if self.is_immutable() else f
+
+    def find_mismatch(self, obj):
+        if not isinstance(obj, self.iterable_type):
+            return None
+        check_elem = _compile_checker(self.elem_type)
+        for i, elem in enumerate(obj):
+            if not check_elem(elem):
+                path, cls, actual = _find_mismatch(elem, self.elem_type)
+                return ['{%r}' % (elem,) if isinstance(obj, (set, frozenset)) else '[%d]' % i] + path, cls, actual
+        return None
+
+    def is_immutable(self):
+        return (issubclass(self.iterable_type, _IMMUTABLE_CONTAINERS) and self.check_strategy[0] == CHECK_ALL and
+                all(t.is_immutable() for t in _split_type(self.elem_type)[1]))
 
 
 class ListOf(IterableOf):
     """Label for list element type assertion"""
 
-    def __init__(self, elem_type):
-        IterableOf.__init__(self, list, elem_type)
+    def __init__(self, elem_type, check=CHECK_ALL):
+        IterableOf.__init__(self, list, elem_type, check)
 
 
 class TupleOf(IterableOf):
     """Label for tuple element type assertion"""
 
-    def __init__(self, elem_type):
-        IterableOf.__init__(self, tuple, elem_type)
+    def __init__(self, elem_type, check=CHECK_ALL):
+        IterableOf.__init__(self, tuple, elem_type, check)
 
 
 class SetOf(IterableOf):
     """Label for set element type assertion"""
 
-    def __init__(self, elem_type):
-        IterableOf.__init__(self, set, elem_type)
+    def __init__(self, elem_type, check=CHECK_ALL):
+        IterableOf.__init__(self, set, elem_type, check)
 
 
 class DictOf(ComposableType):
     """Label for dict element type assertion"""
 
-    def __init__(self, key_type, value_type):
+    def __init__(self, key_type, value_type, check=CHECK_ALL):
         self.key_type = key_type
         self.value_type = value_type
+        self.check_strategy = _parse_check_strategy(check)
 
     def name(self):
         return 'dict(%s->%s)' % (_get_name(self.key_type), _get_name(self.value_type))
 
     def check(self, obj):
-        return isinstance(obj, dict) and all(
-            _check_type(k, self.key_type) and _check_type(v, self.value_type) for k, v in obj.items())
+        return self.checker()(obj)
+
+    def compile(self):
+        key_plain, key_composite = _split_type(self.key_type)
+        value_plain, value_composite = _split_type(self.value_type)
+        select = _compile_selector(*self.check_strategy)
+
+        if not key_composite and not value_composite:
+            def f(obj):
+                if not isinstance(obj, dict):
+                    return False
+                for k, v in (six.iteritems(obj) if select is None else select(six.iteritems(obj), len(obj))):
+                    if not isinstance(k, key_plain) or not isinstance(v, value_plain):
+                        return False
+                return True
+        else:
+            check_key = _compile_checker(self.key_type)
+            check_value = _compile_checker(self.value_type)
+
+            def f(obj):
+                if not isinstance(obj, dict):
+                    return False
+                for k, v in (six.iteritems(obj) if select is None else select(six.iteritems(obj), len(obj))):
+                    if not check_key(k) or not check_value(v):
+                        return False
+                return True
+        return f
+
+    def find_mismatch(self, obj):
+        if not isinstance(obj, dict):
+            return None
+        check_key = _compile_checker(self.key_type)
+        check_value = _compile_checker(self.value_type)
+        for k, v in six.iteritems(obj):
+            if not check_key(k):
+                path, cls, actual = _find_mismatch(k, self.key_type)
+                return ['{%r}' % (k,)] + path, cls, actual
+            if not check_value(v):
+                path, cls, actual = _find_mismatch(v, self.value_type)
+                return ['[%r]' % (k,)] + path, cls, actual
+        return None
 
 
 def VarArg(cls):
@@ -107,6 +291,58 @@ def Option(cls):
     return cls + (type(None),) if isinstance(cls, tuple) else (cls, type(None))
 
 
+#
+# Validation result cache
+#
+_IMMUTABLE_CONTAINERS = (tuple, frozenset)
+
+# smaller containers are faster to check than to look up the cache
+_CACHE_MIN_LENGTH = 8
+
+_result_cache = None
+
+
+def set_cache_size(maxsize):
+    """
+    Enable the cache of validation results for immutable containers such as tuples.
+
+    The results are keyed by the identity of the type spec and the container, and the least recently used ones are
+    discarded. Cached containers are kept alive until they are discarded.
+    :param maxsize: maximum number of the results to keep; 0 disables the cache
+    """
+    global _result_cache
+
+    assert maxsize >= 0, 'maxsize must not be negative.'
+    _result_cache = LRUCache(maxsize) if maxsize else None
+
+
+def cache_info():
+    """
+    :return: dict of hits, misses, maxsize and size of the validation result cache, or None if the cache is disabled
+    """
+    return None if _result_cache is None else _result_cache.info()
+
+
+def _with_result_cache(spec, checker):
+    """Wrap the checker function to look up the validation result cache first."""
+
+    def f(obj):
+        cache = _result_cache
+        if cache is None or not isinstance(obj, _IMMUTABLE_CONTAINERS) or len(obj) < _CACHE_MIN_LENGTH:
+            return checker(obj)
+
+        key = (id(spec), id(obj))
+        entry = cache.get(key)
+        if entry is not None and entry[0] is spec and entry[1] is obj:
+            return entry[2]
+
+        ret = checker(obj)
+        cache.put(key, (spec, obj, ret))
+        return ret
+
+    return f
+
+
 #
 # Helper functions
 #
@@ -119,13 +355,287 @@ def _get_name(cls):
         return cls.__name__
 
 
-def _check_type(obj, cls):
+def _split_type(cls):
+    """
+    Split a type spec into plain types and composable types.
+    :param cls: type spec
+    :return: tuple of (tuple of plain types, list of composable types)
+    """
     if isinstance(cls, ComposableType):
-        return cls.check(obj)
-    elif isinstance(cls, tuple):
-        return any(_check_type(obj, t) for t in cls)
+        return (), [cls]
+    if isinstance(cls, tuple):
+        plain, composite = (), []
+        for t in cls:
+            p, c = _split_type(t)
+            plain += p
+            composite += c
+        return plain, composite
+    return (cls,), []
+
+
+def _compile_checker(cls):
+    """
+    Build a flat checker function for the type spec.
+    :param cls: type spec
+    :return: function: obj -> bool
+    """
+    if isinstance(cls, ComposableType):
+        return cls.checker()
+
+    plain, composite = _split_type(cls)
+    if not composite:
+        return lambda obj: isinstance(obj, plain)
+
+    checkers = [c.checker() for c in composite]
+    if not plain and len(checkers) == 1:
+        return checkers[0]
+    return lambda obj: isinstance(obj, plain) or any(f(obj) for f in checkers)
+
+
+def _find_mismatch(obj, cls):
+    """
+    :return: tuple of (list of path strings, type spec, element) of the innermost mismatched element
+    """
+    for t in _split_type(cls)[1]:
+        found = t.find_mismatch(obj)
+        if found is not None:
+            return found
+    return [], cls, obj
+
+
+#
+# Errors
+#
+class TypeCheckError(TypeError):
+    """
+    Error for type mismatches detected by the types decorator
+
+    The message is formatted only when it is rendered, so raising and catching this error is cheap.
+    """
+
+    def __init__(self, arg_name, expected, actual):
+        """
+        :param arg_name: argument name, or None for the return value
+        :param expected: expected type spec
+        :param actual: actual value
+        """
+        TypeError.__init__(self, arg_name, expected, actual)
+        self.arg_name = arg_name
+        self.expected = expected
+        self.actual = actual
+
+    @property
+    def actual_type(self):
+        return type(self.actual)
+
+    def __str__(self):
+        if self.arg_name is None:
+            return 'must return %s, not %s.' % (_get_name(self.expected), self.actual_type.__name__)
+        return '%s must be %s, not %s.' % (self.arg_name, _get_name(self.expected), self.actual_type.__name__)
+
+    @property
+    def path(self):
+        """Path to the innermost mismatched element in nested containers. e.g. x[3]['key']"""
+        return (self.arg_name or 'return value') + ''.join(_find_mismatch(self.actual, self.expected)[0])
+
+    @property
+    def detail(self):
+        """Message for the innermost mismatched element"""
+        path, cls, actual = _find_mismatch(self.actual, self.expected)
+        return '%s%s must be %s, not %s.' % (
+            self.arg_name or 'return value', ''.join(path), _get_name(cls), type(actual).__name__)
+
+
+#
+# Argument binding
+#
+_POSITIONAL, _VAR_POSITIONAL, _KEYWORD_ONLY, _VAR_KEYWORD, _NOT_FOUND = range(5)
+
+_MISSING = object()
+
+
+def _compile_binding(func, arg_names):
+    """
+    Precompute how to pick each named argument out of (args, kwargs) at call time.
+    :param func: function to be called
+    :param arg_names: argument names to look up
+    :return: list of tuple of name, kind, positional index and default value
+    """
+    spec = get_argspec(func)
+
+    ret = []
+    for name in arg_names:
+        if name in spec.args:
+            ret.append((name, _POSITIONAL, spec.args.index(name), spec.default_map.get(name, _MISSING)))
+        elif name in spec.kwonlyargs:
+            ret.append((name, _KEYWORD_ONLY, None, spec.default_map.get(name, _MISSING)))
+        elif name == spec.varargs:
+            ret.append((name, _VAR_POSITIONAL, len(spec.args), None))
+        elif name == spec.varkw:
+            ret.append((name, _VAR_KEYWORD, None, spec.keywords))
+        else:
+            ret.append((name, _NOT_FOUND, None, None))
+    return ret
+
+
+def _bind_argument(func, binding, args, kwargs):
+    """Get the actual value of the argument described by the binding."""
+    name, kind, index, default = binding
+    if kind == _POSITIONAL:
+        value = args[index] if index < len(args) else kwargs.get(name, default)
+    elif kind == _KEYWORD_ONLY:
+        value = kwargs.get(name, default)
+    elif kind == _VAR_POSITIONAL:
+        return args[index:]
+    elif kind == _VAR_KEYWORD:
+        return dict((k, v) for k, v in kwargs.items() if k not in default)
     else:
-        return isinstance(obj, cls)
+        raise AssertionError('Not found argument: %s' % name)
+
+    if value is _MISSING:
+        # invalid call; let getcallargs raise the same error as the original function does
+        return getcallargs(func, *args, **kwargs)[name]
+    return value
+
+
+#
+# Checking mode
+#
+MODE_OFF, MODE_SAMPLED, MODE_FULL = 'off', 'sampled', 'full'
+
+_MODES = (MODE_OFF, MODE_SAMPLED, MODE_FULL)
+
+_DEFAULT_SAMPLE_INTERVAL = 100
+
+_mode = MODE_FULL
+_sample_interval = _DEFAULT_SAMPLE_INTERVAL
+
+
+def set_mode(mode, sample_interval=None):
+    """
+    Change the checking mode of the types decorator globally.
+
+    Note that functions decorated while the mode is 'off' are left undecorated,
+    so they will not be checked even after the mode is changed.
+    :param mode: 'off': no checks, 'sampled': check only 1-in-N calls, 'full': check every call
+    :param sample_interval: N for the sampled mode
+    """
+    global _mode, _sample_interval
+
+    assert mode in _MODES, 'Invalid mode: %s' % mode
+    assert sample_interval is None or sample_interval > 0, 'sample_interval must be positive.'
+
+    _mode = mode
+    if sample_interval is not None:
+        _sample_interval = sample_interval
+
+
+def get_mode():
+    """
+    :return: tuple of the current global mode and sample interval
+    """
+    return _mode, _sample_interval
+
+
+def _load_mode_from_env():
+    """
+    Initialize the mode with environment variables MOG_COMMONS_TYPES_MODE and MOG_COMMONS_TYPES_SAMPLE_INTERVAL
+    Invalid values are ignored with a warning, so that a typo does not break importing the modules.
+    """
+    mode = os.environ.get('MOG_COMMONS_TYPES_MODE')
+    interval = os.environ.get('MOG_COMMONS_TYPES_SAMPLE_INTERVAL')
+
+    if mode and mode not in _MODES:
+        warnings.warn('Invalid MOG_COMMONS_TYPES_MODE: %s; using %s.' % (mode, _mode), RuntimeWarning)
+        mode = None
+    if interval:
+        try:
+            interval = int(interval)
+            if interval <= 0:
+                raise ValueError
+        except ValueError:
+            warnings.warn('Invalid MOG_COMMONS_TYPES_SAMPLE_INTERVAL: %s; using %d.' % (interval, _sample_interval),
+                          RuntimeWarning)
+            interval = None
+
+    if mode or interval:
+        set_mode(mode or _mode, interval or None)
+
+
+_load_mode_from_env()
+
+
+#
+# Profiling
+#
+def _load_profile_from_env():
+    """
+    Read the environment variable MOG_COMMONS_TYPES_PROFILE: 1, true or on turns on profiling
+    Invalid values are ignored with a warning, as _load_mode_from_env does.
+    :return: True if profiling is turned on
+    """
+    value = os.environ.get('MOG_COMMONS_TYPES_PROFILE', '').strip().lower()
+    if value in ('1', 'true', 'on'):
+        return True
+    if value not in ('', '0', 'false', 'off'):
+        warnings.warn('Invalid MOG_COMMONS_TYPES_PROFILE: %s; profiling is off.' % value, RuntimeWarning)
+    return False
+
+
+_profile_enabled = _load_profile_from_env()
+
+# function -> tuple of function name and stats: [calls, check time, body time]
+# Functions are registered at the first profiled call, and the entries go away with the functions.
+_profile_registry = weakref.WeakKeyDictionary()
+
+
+def set_profile(enabled):
+    """
+    Turn on/off recording of the call counts, cumulative check time and cumulative body time
+    of the functions decorated by types. Only the checked calls are recorded.
+    It can also be turned on with the environment variable MOG_COMMONS_TYPES_PROFILE=1.
+    """
+    global _profile_enabled
+    _profile_enabled = enabled
+
+
+def reset_profile():
+    """Clear all the recorded stats."""
+    _profile_registry.clear()
+
+
+def get_profile():
+    """
+    :return: list of tuple of function name, call count, check time and body time (in seconds)
+             for the functions called at least once
+    """
+    return sorted((name,) + tuple(stats) for name, stats in list(_profile_registry.values()) if stats[0])
+
+
+def report(limit=10):
+    """
+    Make a report of the functions whose checking overhead is the worst, relative to their body time.
+    :param limit: maximum number of the functions to list
+    :return: string: report
+    """
+
+    def ratio(check_time, body_time):
+        return check_time / body_time if body_time else float('inf')
+
+    rows = sorted(get_profile(), key=lambda x: ratio(x[2], x[3]), reverse=True)[:limit]
+    lines = ['%10s %12s %12s %8s  %s' % ('calls', 'check(s)', 'body(s)', 'ratio', 'function')]
+    lines.extend('%10d %12.6f %12.6f %8.2f  %s' % (calls, check_time, body_time, ratio(check_time, body_time), name)
+                 for name, calls, check_time, body_time in rows)
+    return '\n'.join(lines)
+
+
+def _get_profile_stats(func):
+    """Find the stats of the function, registering it if not yet."""
+    entry = _profile_registry.get(func)
+    if entry is None:
+        name = '%s.%s' % (func.__module__, getattr(func, '__qualname__', func.__name__))
+        entry = _profile_registry[func] = (name, [0, 0.0, 0.0])
+    return entry[1]
 
 
 #
@@ -134,39 +644,162 @@ def _check_type(obj, cls):
 def types(*return_type, **arg_types):
     """
     Assert types of the function arguments and return value.
+
+    For a coroutine function, the awaited result is checked as the return value.
+    For an async generator function, each yielded value is checked instead.
     :param return_type: expected type of the return value
     :param arg_types: expected types of the arguments
+                      The following reserved keywords override the global checking mode for this function.
+                        _mode: 'off', 'sampled' or 'full'
+                        _sample_interval: check only 1-in-N calls in the sampled mode
 
     :example:
     @types(float, x=int, y=float, z=ListOf(int))
     def f(x, y, z):
         return x * y + sum(z)
+
+    @types(int, x=ListOf(int), _mode='sampled', _sample_interval=10)
+    def g(x):
+        return sum(x)
     """
     assert len(return_type) <= 1, 'You can specify at most one return type.'
 
-    arg_msg = '%s must be %s, not %s.'
-    return_msg = 'must return %s, not %s.'
+    fixed_mode = arg_types.pop('_mode', None)
+    fixed_interval = arg_types.pop('_sample_interval', None)
+    assert fixed_mode is None or fixed_mode in _MODES, 'Invalid mode: %s' % fixed_mode
+    assert fixed_interval is None or fixed_interval > 0, '_sample_interval must be positive.'
+
+    return_checker = _compile_checker(return_type[0]) if return_type else None
 
     def f(func):
         import functools
 
+        if (fixed_mode or _mode) == MODE_OFF:
+            # zero-cost: no wrapper at all
+            return func
+
+        # resolve argument positions only once
+        bindings = [(b, arg_types[b[0]], _compile_checker(arg_types[b[0]]))
+                    for b in _compile_binding(func, arg_types)]
+
+        def check_args(args, kwargs):
+            num_args = len(args)
+            for binding, expect, checker in bindings:
+                if binding[1] == _POSITIONAL and binding[2] < num_args:
+                    actual = args[binding[2]]
+                else:
+                    actual = _bind_argument(func, binding, args, kwargs)
+                if not checker(actual):
+                    raise TypeCheckError(binding[0], expect, actual)
+
+        def check_return(ret):
+            if return_checker is not None and not return_checker(ret):
+                raise TypeCheckError(None, return_type[0], ret)
+
+        call_count = [0]
+
+        def should_check():
+            mode = fixed_mode or _mode
+            if mode == MODE_FULL:
+                return True
+            if mode == MODE_OFF:
+                return False
+            # check the first call and then every N-th call
+            n = call_count[0]
+            call_count[0] = n + 1
+            return n % (fixed_interval or _sample_interval) == 0
+
+        # profiling is not supported for asynchronous functions
+        if isasyncgenfunction(func):
+            return wrap_async_generator_function(func, should_check, check_args, check_return)
+        if iscoroutinefunction(func):
+            return wrap_coroutine_function(func, should_check, check_args, check_return)
+
         @functools.wraps(func)
         def wrapper(*args, **kwargs):
-            # convert args to call args
-            call_args = getcallargs(func, *args, **kwargs)
-
-            for arg_name, expect in arg_types.items():
-                assert arg_name in call_args, 'Not found argument: %s' % arg_name
-                actual = call_args[arg_name]
-                if not _check_type(actual, expect):
-                    raise TypeError(arg_msg % (arg_name, _get_name(expect), type(actual).__name__))
-
+            if (fixed_mode or _mode) != MODE_FULL and not should_check():
+                return func(*args, **kwargs)
+
+            if _profile_enabled:
+                t0 = default_timer()
+                check_args(args, kwargs)
+                t1 = default_timer()
+                ret = func(*args, **kwargs)
+                t2 = default_timer()
+                check_return(ret)
+                t3 = default_timer()
+                stats = _get_profile_stats(func)
+                stats[0] += 1
+                stats[1] += t1 - t0 + t3 - t2
+                stats[2] += t2 - t1
+                return ret
+
+            check_args(args, kwargs)
             ret = func(*args, **kwargs)
-            if return_type:
-                if not _check_type(ret, return_type[0]):
-                    raise TypeError(return_msg % (_get_name(return_type[0]), type(ret).__name__))
+            check_return(ret)
             return ret
 
         return wrapper
 
     return f
+
+
+#
+# Batch validation
+#
+def _invalid_reason(obj, cls):
+    """Describe the innermost mismatched element, prefixed with its path in the item if nested."""
+    path, expected, actual = _find_mismatch(obj, cls)
+    return '%smust be %s, not %s.' % (''.join(path) + ' ' if path else '', _get_name(expected), type(actual).__name__)
+
+
+def validate_many(cls, iterable, max_errors=None):
+    """
+    Check all the items against one type spec in a single pass.
+    The spec is compiled only once and the iterable is consumed lazily, so generators are not materialized.
+    :param cls: type spec
+    :param iterable: items to check
+    :param max_errors: stop checking when the number of the invalid items reaches this value
+    :return: list of tuple of the index and the reason of the invalid items; empty if all the items are valid
+             The reason points to the innermost mismatched element in nested containers.
+
+    :example:
+    validate_many(DictOf(int, int), [{1: 1}, {1: 'x'}, []])
+    # [(1, '[1] must be int, not str.'), (2, 'must be dict(int->int), not list.')]
+    """
+    assert max_errors is None or max_errors > 0, 'max_errors must be positive.'
+
+    checker = _compile_checker(cls)
+    errors = []
+    for i, obj in enumerate(iterable):
+        if not checker(obj):
+            errors.append((i, _invalid_reason(obj, cls)))
+            if max_errors is not None and len(errors) >= max_errors:
+                break
+    return errors
+
+
+def iter_validated(cls, iterable):
+    """
+    Yield the items lazily after checking each of them against one type spec.
+    The spec is compiled only once.
+    :param cls: type spec
+    :param iterable: items to check
+    :return: generator of the items
+    :raise TypeCheckError: when an invalid item is found; the message includes the index
+    """
+    checker = _compile_checker(cls)
+    for i, obj in enumerate(iterable):
+        if not checker(obj):
+            raise TypeCheckError('item %d' % i, cls, obj)
+        yield obj
+
+
+types.set_mode = set_mode
+types.get_mode = get_mode
+types.set_cache_size = set_cache_size
+types.cache_info = cache_info
+types.set_profile = set_profile
+types.reset_profile = reset_profile
+types.get_profile = get_profile
+types.report = report
@@ -0,0 +1,69 @@
+"""
+Wrappers of the types decorator for coroutine functions and async generator functions
+
+This module requires Python 3.6+.
+"""
+
+import functools
+
+
+def wrap_coroutine_function(func, should_check, check_args, check_return):
+    """
+    :param func: coroutine function
+    :param should_check: function: () -> bool: returns false if the call should not be checked
+    :param check_args: function: (args, kwargs) -> None
+    :param check_return: function: awaited result -> None
+    :return: coroutine function
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        if not should_check():
+            return await func(*args, **kwargs)
+
+        check_args(args, kwargs)
+        ret = await func(*args, **kwargs)
+        check_return(ret)
+        return ret
+
+    return wrapper
+
+
+def wrap_async_generator_function(func, should_check, check_args, check_return):
+    """
+    :param func: async generator function
+    :param should_check: function: () -> bool: returns false if the call should not be checked
+    :param check_args: function: (args, kwargs) -> None
+    :param check_return: function: each yielded value -> None
+    :return: async generator function
+    """
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        checked = should_check()
+        if checked:
+            check_args(args, kwargs)
+
+        agen = func(*args, **kwargs)
+        try:
+            value = await agen.__anext__()
+            while True:
+                if checked:
+                    try:
+                        check_return(value)
+                    except BaseException:
+                        await agen.aclose()
+                        raise
+                try:
+                    sent = yield value
+                except GeneratorExit:
+                    await agen.aclose()
+                    raise
+                except BaseException as e:
+                    value = await agen.athrow(e)
+                else:
+                    value = await agen.asend(sent)
+        except StopAsyncIteration:
+            return
+
+    return wrapper
@@ -14,7 +14,7 @@ if sys.version_info < (2, 7):
 else:
     import unittest as base_unittest
 
-from mog_commons.string import to_bytes, to_str
+from mog_commons.string import to_bytes_unchecked, to_str
 from mog_commons.types import *
 
 __all__ = [
@@ -35,10 +35,10 @@ class StringBuffer(object):
         self._buffer = init_buffer or b''
 
     def write(self, s, encoding='utf-8', errors='strict'):
-        self._buffer += to_bytes(s, encoding, errors)
+        self._buffer += to_bytes_unchecked(s, encoding, errors)
 
     def writelines(self, lines, encoding='utf-8', errors='strict'):
-        self._buffer += b''.join(to_bytes(s, encoding, errors) for s in lines)
+        self._buffer += b''.join(to_bytes_unchecked(s, encoding, errors) for s in lines)
 
     def flush(self):
         """do nothing"""
@@ -56,7 +56,7 @@ class BytesBuffer(six.BytesIO):
 
     @types(s=String)
     def write(self, s, encoding='utf-8', errors='strict'):
-        six.BytesIO.write(self, to_bytes(s, encoding, errors))
+        six.BytesIO.write(self, to_bytes_unchecked(s, encoding, errors))
 
 
 class FakeInput(six.StringIO):
@@ -0,0 +1,83 @@
+"""
+Sample asynchronous functions for the tests
+
+This module is imported only by the tests for Python 3.6+ because of the syntax.
+"""
+
+import asyncio
+from mog_commons.types import *
+
+
+@types(int, x=int)
+async def coroutine_func(x):
+    await asyncio.sleep(0)
+    return x * 2
+
+
+@types(int, x=int)
+async def bad_coroutine_func(x):
+    await asyncio.sleep(0)
+    return str(x)
+
+
+@types(int, n=int)
+async def async_gen_func(n, bad_index=None):
+    for i in range(n):
+        await asyncio.sleep(0)
+        yield str(i) if i == bad_index else i
+
+
+closed = []
+
+
+@types(int)
+async def closing_gen_func():
+    try:
+        yield 1
+        yield 'x'
+        yield 3
+    finally:
+        closed.append(True)
+
+
+@types(int)
+async def echo_gen_func():
+    x = 0
+    while True:
+        try:
+            x = yield x
+        except ValueError:
+            x = -1
+
+
+def run(coroutine):
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+async def collect(agen):
+    return [x async for x in agen]
+
+
+async def talk(agen, values):
+    ret = [await agen.asend(None)]
+    for v in values:
+        ret.append(await agen.asend(v))
+    ret.append(await agen.athrow(ValueError))
+    await agen.aclose()
+    return ret
+
+
+async def gather(*coroutines):
+    return await asyncio.gather(*coroutines)
+
+
+async def cancel_after(coroutine, delay, before_cancel):
+    task = asyncio.ensure_future(coroutine)
+    await asyncio.sleep(delay)
+    before_cancel()
+    task.cancel()
+    await asyncio.wait([task])
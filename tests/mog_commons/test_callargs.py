@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+from __future__ import division, print_function, absolute_import, unicode_literals
+
+import sys
+from mog_commons.callargs import *
+from mog_commons import unittest
+
+if sys.version_info < (2, 7):
+    from mog_commons.backported.inspect2 import getcallargs as expected_callargs
+else:
+    from inspect import getcallargs as expected_callargs
+
+
+class TestCallArgs(unittest.TestCase):
+    @staticmethod
+    def func1(a, b, c=3, *args, **kwargs):
+        pass
+
+    @staticmethod
+    def func2(a, b=2):
+        pass
+
+    @staticmethod
+    def func3():
+        pass
+
+    def method(self, x, y=10):
+        pass
+
+    @classmethod
+    def class_method(cls, x):
+        pass
+
+    def assertSameCallArgs(self, func, *args, **kwargs):
+        self.assertEqual(getcallargs(func, *args, **kwargs), expected_callargs(func, *args, **kwargs))
+
+    def assertSameError(self, func, *args, **kwargs):
+        with self.assertRaises(TypeError) as cm:
+            expected_callargs(func, *args, **kwargs)
+        self.assertRaisesMessage(TypeError, str(cm.exception), getcallargs, func, *args, **kwargs)
+
+    def test_getcallargs(self):
+        self.assertSameCallArgs(self.func1, 1, 2)
+        self.assertSameCallArgs(self.func1, 1, 2, 3, 4, 5)
+        self.assertSameCallArgs(self.func1, 1, b=2, x=4)
+        self.assertSameCallArgs(self.func1, c=1, b=2, a=4, args=5)
+        self.assertSameCallArgs(self.func2, 1)
+        self.assertSameCallArgs(self.func2, a=1, b=3)
+        self.assertSameCallArgs(self.func3)
+        self.assertSameCallArgs(self.method, 1)
+        self.assertSameCallArgs(self.method, x=1, y=2)
+        self.assertSameCallArgs(self.class_method, 1)
+        self.assertSameCallArgs(lambda *args: 0, 1, 2, 3)
+        self.assertSameCallArgs(lambda **kwargs: 0, x=1)
+
+    def test_getcallargs_error(self):
+        self.assertSameError(self.func1, 1)
+        self.assertSameError(self.func1, 1, 2, a=3)
+        self.assertSameError(self.func2, 1, 2, 3)
+        self.assertSameError(self.func2, 1, c=3)
+        self.assertSameError(self.func2, b=3)
+        self.assertSameError(self.func3, 1)
+        self.assertSameError(self.method)
+
+    def test_get_argspec(self):
+        spec = get_argspec(self.func1)
+        self.assertTrue(get_argspec(self.func1) is spec)
+        self.assertEqual(spec.args, ('a', 'b', 'c'))
+        self.assertEqual(spec.varargs, 'args')
+        self.assertEqual(spec.varkw, 'kwargs')
+        self.assertEqual(spec.default_map, {'c': 3})
+        self.assertEqual(spec.num_names, 5)
@@ -1,5 +1,7 @@
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import sys
+import threading
 from mog_commons.collection import *
 from mog_commons import unittest
 
@@ -40,3 +42,61 @@ class TestCollection(unittest.TestCase):
         self.assertEqual(distinct([1, 2, 1, 2, 1]), [1, 2])
         self.assertEqual(distinct([2, 1, 2, 1, 1]), [2, 1])
         self.assertEqual(distinct('mog-commons-python'), ['m', 'o', 'g', '-', 'c', 'n', 's', 'p', 'y', 't', 'h'])
+
+    def test_lru_cache(self):
+        c = LRUCache(2)
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.get('a'), None)
+        self.assertEqual(c.get('a', 0), 0)
+        c.put('a', 1)
+        c.put('b', 2)
+        self.assertEqual(c.get('a'), 1)
+        c.put('c', 3)  # 'b' is discarded
+        self.assertFalse('b' in c)
+        self.assertTrue('a' in c)
+        self.assertTrue('c' in c)
+        c.put('a', 10)
+        c.put('d', 4)  # 'c' is discarded
+        self.assertEqual(c.get('a'), 10)
+        self.assertEqual(c.get('c'), None)
+        self.assertEqual(c.get('d'), 4)
+        self.assertEqual(c.info(), {'hits': 3, 'misses': 3, 'maxsize': 2, 'size': 2})
+        c.clear()
+        self.assertEqual(len(c), 0)
+        self.assertEqual(c.get('a'), None)
+        c.put('x', 1)
+        self.assertEqual(c.get('x'), 1)
+
+    def test_lru_cache_threads(self):
+        c = LRUCache(20)
+        errors = []
+
+        def work(n):
+            try:
+                for i in range(20000):
+                    key = (n * i) % 50
+                    if c.get(key) is None:
+                        c.put(key, i)
+            except Exception as e:
+                errors.append(e)
+
+        interval = sys.getswitchinterval() if hasattr(sys, 'getswitchinterval') else None
+        if interval is not None:
+            sys.setswitchinterval(1e-6)
+        try:
+            threads = [threading.Thread(target=work, args=(n,)) for n in range(1, 9)]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+
+        self.assertEqual(errors, [])
+        self.assertEqual(len(c), 20)
+        info = c.info()
+        self.assertEqual(info['hits'] + info['misses'], 8 * 20000)
+
+    def test_lru_cache_error(self):
+        self.assertRaisesRegexp(AssertionError, 'maxsize must be positive.', LRUCache, 0)
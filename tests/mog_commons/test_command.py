@@ -2,13 +2,21 @@
 from __future__ import division, print_function, absolute_import, unicode_literals
 
 import os
+import sys
+import signal
 import time
 import threading
 import tempfile
+import six
+import mog_commons
 from mog_commons.command import *
 from mog_commons import unittest
 
 
+def collect_stdout(stream):
+    return [data for name, data in stream if name == 'stdout']
+
+
 class TestCommand(unittest.TestCase):
     def test_execute_command(self):
         self.assertEqual(execute_command(['exit', '2'], shell=True), 2)
@@ -58,5 +66,313 @@ class TestCommand(unittest.TestCase):
 
         self.assertEqual(execute_command_with_pid(['exit', '2'], None, shell=True), 2)
 
+    def test_asyncio_not_imported(self):
+        # asyncio is imported only when the asyncio variants are called
+        code = 'import sys, mog_commons.command; print("asyncio" in sys.modules)'
+        path = os.path.dirname(os.path.dirname(mog_commons.__file__))
+        self.assertEqual(capture_command([sys.executable, '-c', code], env={'PYTHONPATH': path})[1].strip(), b'False')
+
+    @unittest.base_unittest.skipUnless(sys.version_info >= (3, 6), 'requires Python 3.6+')
+    def test_async_capture_command(self):
+        from tests.mog_commons.async_functions import run, gather
+
+        self.assertEqual(run(async_capture_command(['echo', 'abc'], shell=True)),
+                         (0, ('abc' + os.linesep).encode('utf-8'), b''))
+        self.assertEqual(run(async_capture_command('exit 3', shell=True)), (3, b'', b''))
+        self.assertEqual(run(async_capture_command(['/bin/sh', '-c', 'echo あい'], shell=False)),
+                         (0, ('あい' + os.linesep).encode('utf-8'), b''))
+        self.assertEqual(run(async_capture_command(['/bin/sh', '-c', 'echo $X'], env={'X': 'あ'})),
+                         (0, ('あ' + os.linesep).encode('utf-8'), b''))
+
+        commands = [[sys.executable, '-c', 'import time;time.sleep(0.5);print(%d)' % i] for i in range(5)]
+        t = time.time()
+        self.assertEqual([r[1].strip() for r in run(gather(*[async_capture_command(c) for c in commands]))],
+                         [b'0', b'1', b'2', b'3', b'4'])
+        self.assertLess(time.time() - t, 2)
+
+    @unittest.base_unittest.skipUnless(sys.version_info >= (3, 6), 'requires Python 3.6+')
+    def test_async_execute_command(self):
+        from tests.mog_commons.async_functions import run
+
+        self.assertEqual(run(async_execute_command(['exit', '2'], shell=True)), 2)
+        self.assertEqual(run(async_execute_command(['/bin/sh', '-c', 'exit 4'])), 4)
+        self.assertEqual(run(async_execute_command_with_pid(['exit', '2'], None, shell=True)), 2)
+
+        pid_file = os.path.join(tempfile.gettempdir(), 'mog-commons-python-test-async.pid')
+        self.assertEqual(run(async_execute_command_with_pid('exit 5', pid_file, shell=True)), 5)
+        self.assertFalse(os.path.exists(pid_file))
+
+    @unittest.base_unittest.skipUnless(sys.version_info >= (3, 6), 'requires Python 3.6+')
+    def test_async_command_cancel(self):
+        import asyncio
+        from tests.mog_commons.async_functions import run, cancel_after
+
+        pid_file = os.path.join(tempfile.gettempdir(), 'mog-commons-python-test-async.pid')
+        pids = []
+
+        def read_pid():
+            with open(pid_file) as f:
+                pids.append(int(f.read()))
+
+        t = time.time()
+        run(cancel_after(
+            async_execute_command_with_pid([sys.executable, '-c', 'import time;time.sleep(5)'], pid_file), 1, read_pid))
+        self.assertLess(time.time() - t, 3)
+        self.assertFalse(pid_exists(pids[0]))
+        self.assertFalse(os.path.exists(pid_file))
+
+        self.assertRaises(asyncio.TimeoutError, run, asyncio.wait_for(
+            async_capture_command([sys.executable, '-c', 'import time;time.sleep(5)']), 0.5))
+
+    def test_run_many(self):
+        self.assertEqual(list(run_many([])), [])
+
+        commands = [['exit', str(i)] for i in range(10)]
+        self.assertEqual(list(run_many(commands, shell=True)), [(i, b'', b'') for i in range(10)])
+        self.assertEqual(list(run_many(iter(commands), max_workers=1, shell=True)), [(i, b'', b'') for i in range(10)])
+        self.assertEqual(sorted(run_many(commands, max_workers=3, ordered=False, shell=True)),
+                         [(i, (i, b'', b'')) for i in range(10)])
+        if os.name != 'nt':
+            self.assertEqual(list(run_many([['echo', 'あい']], shell=True)),
+                             [(0, ('あい' + os.linesep).encode('utf-8'), b'')])
+
+    def test_run_many_parallel(self):
+        def sleep(sec):
+            return [sys.executable, '-c', 'import time;time.sleep(%s);print(%s)' % (sec, sec)]
+
+        t = time.time()
+        actual = list(run_many([sleep(0.6), sleep(0.1), sleep(0.3)], max_workers=3, ordered=False))
+        self.assertLess(time.time() - t, 1.0)
+        self.assertEqual([i for i, _ in actual], [1, 2, 0])
+        self.assertEqual(actual[0][1][1].strip(), b'0.1')
+
+        # ordered results
+        actual = list(run_many([sleep(0.6), sleep(0.1), sleep(0.3)], max_workers=3))
+        self.assertEqual([r[1].strip() for r in actual], [b'0.6', b'0.1', b'0.3'])
+
+        # bounded number of the workers
+        t = time.time()
+        list(run_many([sleep(0.3)] * 4, max_workers=2))
+        self.assertGreaterEqual(time.time() - t, 0.6)
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_run_many_timeout(self):
+        t = time.time()
+        commands = [[sys.executable, '-c', 'import time;time.sleep(5)'], [sys.executable, '-c', 'exit(3)']]
+        self.assertEqual(list(run_many(commands, timeout=0.5)), [(-9, b'', b''), (3, b'', b'')])
+        self.assertLess(time.time() - t, 3)
+
+    def test_run_many_error(self):
+        self.assertRaisesRegexp(AssertionError, 'max_workers must be positive.', list, run_many([], max_workers=0))
+        self.assertRaisesRegexp(AssertionError, 'timeout must be positive.', list, run_many([], timeout=0))
+        self.assertRaises(OSError, list, run_many([['exit', '0'], ['mog-commons-no-such-command']]))
+
+    def test_run_many_kill(self):
+        pid_file = os.path.join(tempfile.gettempdir(), 'mog-commons-python-test-run-many.pid')
+        slow = [sys.executable, '-c', 'import os,time;open(%r,"w").write(str(os.getpid()));time.sleep(5)' % pid_file]
+
+        def read_pid():
+            with open(pid_file) as f:
+                return int(f.read())
+
+        try:
+            # stop iterating early
+            it = run_many([[sys.executable, '-c', 'import time;time.sleep(0.5)'], slow], max_workers=2)
+            self.assertEqual(next(it), (0, b'', b''))
+            pid = read_pid()
+            it.close()
+            time.sleep(0.5)
+            self.assertFalse(pid_exists(pid))
+
+            # a command raises an exception
+            t = time.time()
+            commands = [slow, [sys.executable, '-c', 'import time;time.sleep(0.5)'], ['mog-commons-no-such-command']]
+            it = run_many(commands, max_workers=2, ordered=False)
+            self.assertEqual(next(it), (1, (0, b'', b'')))
+            pid = read_pid()
+            self.assertRaises(OSError, list, it)
+            time.sleep(0.5)
+            self.assertFalse(pid_exists(pid))
+            self.assertLess(time.time() - t, 3)
+        finally:
+            if os.path.exists(pid_file):
+                os.remove(pid_file)
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_stream_command(self):
+        script = 'import sys;sys.stdout.write("a\\nbc\\nd");sys.stderr.write("x\\n");sys.exit(3)'
+        st = stream_command([sys.executable, '-c', script])
+        self.assertEqual(b''.join(collect_stdout(st)), b'a\nbc\nd')
+        self.assertEqual(st.returncode, 3)
+
+        st = stream_command([sys.executable, '-c', script], lines=True)
+        self.assertEqual(sorted(st), [('stderr', b'x\n'), ('stdout', b'a\n'), ('stdout', b'bc\n'), ('stdout', b'd')])
+        self.assertEqual(st.truncated, {'stdout': 0, 'stderr': 0})
+
+        # decoding with fallback
+        sjis = 'あいう'.encode('sjis')
+        st = stream_command(['/bin/sh', '-c', 'printf "%s"' % ''.join('\\%03o' % c for c in six.iterbytes(sjis))],
+                            encoding_list=['utf-8', 'sjis'], chunk_size=1)
+        self.assertEqual(''.join(collect_stdout(st)), 'あいう')
+        self.assertEqual(st.returncode, 0)
+
+        st = stream_command(['echo', 'あいう'], shell=True, encoding_list='ascii')
+        self.assertRaises(UnicodeDecodeError, list, st)
+
+        # decoded lines are yielded as they arrive
+        t = time.time()
+        st = stream_command(['/bin/sh', '-c', 'echo a; sleep 2; echo b'], encoding_list='utf-8', lines=True)
+        for name, data in st:
+            self.assertEqual((name, data), ('stdout', 'a\n'))
+            self.assertLess(time.time() - t, 1)
+            break
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_stream_command_max_size(self):
+        script = 'import sys;sys.stdout.write("".join("%d\\n" % i for i in range(10)))'
+        st = stream_command([sys.executable, '-c', script], max_size=5, tail_size=3)
+        self.assertEqual(collect_stdout(st), [b'0\n1\n2', b'\n9\n'])
+        self.assertEqual(st.truncated, {'stdout': 12, 'stderr': 0})
+
+        st = stream_command([sys.executable, '-c', script], lines=True, max_size=5, tail_size=5)
+        self.assertEqual(collect_stdout(st), [b'0\n', b'1\n', b'8\n', b'9\n'])
+        self.assertEqual(st.truncated, {'stdout': 12, 'stderr': 0})
+
+        st = stream_command([sys.executable, '-c', script], encoding_list='utf-8', lines=True, max_size=0)
+        self.assertEqual(collect_stdout(st), [])
+        self.assertEqual(st.truncated, {'stdout': 20, 'stderr': 0})
+
+    def test_stream_command_close(self):
+        # the command blocks on writing while the consumer does not read
+        script = 'import sys\nwhile True: sys.stdout.write("x" * 1024)'
+        st = stream_command([sys.executable, '-c', script], chunk_size=1024, queue_size=2)
+        for name, data in st:
+            self.assertEqual(data, b'x' * len(data))
+            break
+        self.assertIsNotNone(st.returncode)
+        self.assertFalse(pid_exists(st.process.pid))
+
+        with stream_command([sys.executable, '-c', script]) as st:
+            next(iter(st))
+        self.assertIsNotNone(st.returncode)
+
+    def test_convert_env(self):
+        from mog_commons import command
+        convert_env = getattr(command, '__convert_env')
+
+        key = 'MOG_COMMONS_TEST_ENV'
+        os.environ.pop(key, None)
+        try:
+            base = convert_env(None, 'utf-8')
+            self.assertIs(convert_env({}, 'utf-8'), base)
+            self.assertNotIn(key.encode('utf-8'), base)
+
+            d = convert_env({key: 'あ'}, 'sjis')
+            self.assertEqual(d[key.encode('sjis')], 'あ'.encode('sjis'))
+            self.assertIs(convert_env(d, 'utf-8'), d)
+
+            # the cache is invalidated when os.environ changes
+            os.environ[key] = 'x'
+            self.assertEqual(convert_env(None, 'utf-8')[key.encode('utf-8')], b'x')
+            self.assertNotIn(key.encode('utf-8'), base)
+            os.environ[key] = 'y'
+            self.assertEqual(convert_env(None, 'utf-8')[key.encode('utf-8')], b'y')
+            self.assertEqual(convert_env({key: 'z'}, 'utf-8')[key.encode('utf-8')], b'z')
+            self.assertEqual(convert_env(None, 'utf-8')[key.encode('utf-8')], b'y')
+        finally:
+            os.environ.pop(key, None)
+        self.assertNotIn(key.encode('utf-8'), convert_env(None, 'utf-8'))
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_command_context(self):
+        ctx = CommandContext(cwd=tempfile.gettempdir(), env={'MOG_COMMONS_TEST_ENV': 'あい'})
+        self.assertEqual(ctx.cmd_encoding, 'utf-8')
+        self.assertEqual(ctx.env, prepare_env({'MOG_COMMONS_TEST_ENV': 'あい'}))
+        self.assertEqual(repr(ctx), 'CommandContext(cwd=%r, env=<%d variables>, cmd_encoding=%r)' % (
+            tempfile.gettempdir(), len(ctx.env), 'utf-8'))
+        self.assertFalse('MOG_COMMONS_TEST_ENV' in repr(ctx))
+        self.assertEqual(ctx.capture_command('echo $MOG_COMMONS_TEST_ENV', shell=True),
+                         (0, ('あい' + os.linesep).encode('utf-8'), b''))
+        self.assertEqual(ctx.capture_command(['/bin/sh', '-c', 'pwd'])[1].strip(),
+                         os.path.realpath(tempfile.gettempdir()).encode('utf-8'))
+        self.assertEqual(ctx.execute_command(['exit', '2'], shell=True), 2)
+        self.assertEqual(ctx.run_command('echo $MOG_COMMONS_TEST_ENV', shell=True, capture=True, timeout=5).stdout,
+                         ('あい' + os.linesep).encode('utf-8'))
+        self.assertEqual(ctx.execute_command_with_pid(['exit', '3'], shell=True), 3)
+        self.assertEqual(list(ctx.run_many([['exit', '1'], 'echo $MOG_COMMONS_TEST_ENV'], shell=True)),
+                         [(1, b'', b''), (0, ('あい' + os.linesep).encode('utf-8'), b'')])
+        self.assertEqual(collect_stdout(ctx.stream_command('echo $MOG_COMMONS_TEST_ENV', shell=True, lines=True,
+                                                           encoding_list='utf-8')), ['あい' + os.linesep])
+
+        ctx2 = CommandContext(env={'MOG_COMMONS_TEST_ENV': 'あい'}, cmd_encoding='sjis')
+        self.assertEqual(ctx2.capture_command('echo $MOG_COMMONS_TEST_ENV', shell=True),
+                         (0, ('あい' + os.linesep).encode('sjis'), b''))
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_run_command(self):
+        r = run_command(['/bin/sh', '-c', 'echo あい; echo x >&2; exit 3'], capture=True)
+        self.assertEqual((r.returncode, r.stdout, r.stderr, r.timed_out),
+                         (3, ('あい' + os.linesep).encode('utf-8'), b'x' + os.linesep.encode('utf-8'), False))
+        self.assertGreater(r.wall_time, 0)
+        self.assertGreaterEqual(r.user_time + r.system_time, 0)
+        self.assertGreater(r.max_rss, 0)
+
+        r = run_command([sys.executable, '-c', 'x = bytearray(50 * 1024 * 1024); sum(range(3000000))'])
+        self.assertEqual((r.returncode, r.stdout, r.stderr), (0, None, None))
+        self.assertGreater(r.max_rss, 50 * 1024 * 1024)
+        self.assertGreater(r.user_time, 0)
+
+        self.assertRaisesRegexp(AssertionError, 'timeout must be positive.', run_command, ['exit'], timeout=0)
+        self.assertRaisesRegexp(AssertionError, 'max_memory must be positive.', run_command, ['exit'], max_memory=0)
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_run_command_timeout(self):
+        # the whole process group is killed
+        t = time.time()
+        r = run_command('sleep 5 & sleep 5; echo done', shell=True, capture=True, timeout=0.5)
+        self.assertLess(time.time() - t, 3)
+        self.assertEqual((r.returncode, r.stdout, r.timed_out), (-9, b'', True))
+
+        self.assertEqual(execute_command([sys.executable, '-c', 'import time;time.sleep(5)'], timeout=0.5), -9)
+        self.assertEqual(capture_command(['echo', 'abc'], shell=True, timeout=5),
+                         (0, ('abc' + os.linesep).encode('utf-8'), b''))
+        self.assertFalse(run_command(['/bin/sh', '-c', 'exit 2'], timeout=5).timed_out)
+
+        # the command leads its own process group, also when it is started from threads
+        code = 'import os; print(os.getpgid(0) == os.getpid())'
+        self.assertEqual(list(run_many([[sys.executable, '-c', code]] * 4, timeout=5)),
+                         [(0, ('True' + os.linesep).encode('utf-8'), b'')] * 4)
+
+    def test_run_command_timeout_windows(self):
+        # on Windows, only the command itself is killed without a new process group
+        code = ('import os, sys, time; sys.stdout.write(str(os.name != "nt" and os.getpgid(0) == os.getpid())); '
+                'sys.stdout.flush(); time.sleep(5)')
+        name = os.name
+        try:
+            os.name = 'nt'
+            t = time.time()
+            r = run_command([sys.executable, '-c', code], capture=True, timeout=1)
+        finally:
+            os.name = name
+        self.assertLess(time.time() - t, 4)
+        self.assertTrue(r.timed_out)
+        self.assertNotEqual(r.returncode, 0)
+        self.assertEqual(r.stdout.strip(), b'False')
+
+    @unittest.base_unittest.skipUnless(os.name != 'nt', 'requires POSIX compatible')
+    def test_run_command_limits(self):
+        r = run_command([sys.executable, '-c', 'x = bytearray(1024 * 1024 * 1024)'], capture=True,
+                        max_memory=256 * 1024 * 1024)
+        self.assertEqual(r.returncode, 1)
+        self.assertIn(b'MemoryError', r.stderr)
+
+        r = run_command([sys.executable, '-c', 'while True: pass'], max_cpu_time=1, timeout=10)
+        self.assertEqual(r.returncode, -signal.SIGXCPU)
+        self.assertFalse(r.timed_out)
+        self.assertGreaterEqual(r.user_time + r.system_time, 0.9)
+
+        self.assertEqual(capture_command(['echo', 'abc'], shell=True, max_memory=256 * 1024 * 1024, max_cpu_time=5),
+                         (0, ('abc' + os.linesep).encode('utf-8'), b''))
+
     def test_pid_exists(self):
         self.assertTrue(pid_exists(0))
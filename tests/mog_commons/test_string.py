@@ -1,15 +1,114 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import os
+import io
+import sys
+import codecs
+import subprocess
+import threading
 import six
 from mog_commons import string, unittest
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 
 class TestString(unittest.TestCase):
     def test_unicode_width(self):
         self.assertEqual(string.unicode_width(b'abc'), 3)
         self.assertEqual(string.unicode_width('あいう'.encode('utf-8')), 9)
         self.assertEqual(string.unicode_width('あいう'), 6)
+        self.assertEqual(string.unicode_width(''), 0)
+        self.assertEqual(string.unicode_width('abc'), 3)
+        self.assertEqual(string.unicode_width('ｱｲｳ'), 3)
+        self.assertEqual(string.unicode_width('αβγ'), 6)
+        self.assertEqual(string.unicode_width('aあ\u3000\t'), 6)
+
+    def test_unicode_widths(self):
+        self.assertEqual(string.unicode_widths([]), [])
+        self.assertEqual(string.unicode_widths(['abc', '', b'de']), [3, 0, 2])
+        self.assertEqual(string.unicode_widths(iter(['abc', 'あいう', '', 'ｱｲｳ', 'aあ'.encode('utf-8'), 'αβ'])),
+                         [3, 6, 0, 3, 4, 4])
+
+        xs = ['あいうえおabc' * (i % 7) for i in range(1000)]
+        self.assertEqual(string.unicode_widths(xs), [string.unicode_width(x) for x in xs])
+
+    @unittest.base_unittest.skipUnless(numpy is not None, 'requires NumPy')
+    def test_unicode_widths_numpy(self):
+        xs = ['あいうえおabc' * (i % 7) for i in range(1000)] + [b'abc', '']
+        count_wide = getattr(string, '__count_wide')
+        count_wide_numpy = getattr(string, '__count_wide_numpy')
+        us = [x for x in xs if string.is_unicode(x)]
+        widths = getattr(string, '__to_widths')(''.join(us))
+        self.assertEqual(count_wide_numpy(numpy, widths, us), count_wide(widths, us))
+
+        self.assertEqual(string.unicode_widths(xs), [string.unicode_width(x) for x in xs])
+        self.assertTrue(getattr(string, '__numpy') is numpy)
+
+    def test_numpy_not_imported(self):
+        # NumPy is imported only when a large input is given
+        code = 'import sys, mog_commons.string; print("numpy" in sys.modules)'
+        path = os.path.dirname(os.path.dirname(string.__file__))
+        out = subprocess.check_output([sys.executable, '-c', code], env=dict(os.environ, PYTHONPATH=path))
+        self.assertEqual(out.strip(), b'False')
+
+    def test_max_unicode_width(self):
+        self.assertEqual(string.max_unicode_width([]), 0)
+        self.assertEqual(string.max_unicode_width(['abc', 'あいう', 'ｱｲｳ']), 6)
+
+    def test_width_cache(self):
+        self.assertEqual(string.width_cache_info(), None)
+        try:
+            string.set_width_cache_size(3)
+            self.assertEqual(string.unicode_width('あいう'), 6)
+            self.assertEqual(string.unicode_width('あいう'), 6)
+            self.assertEqual(string.unicode_width('abc'), 3)  # bypass
+            self.assertEqual(string.width_cache_info(), {'hits': 1, 'misses': 1, 'maxsize': 3, 'size': 1})
+
+            self.assertEqual(string.unicode_ljust('あいう', 10), 'あいう    ')
+            self.assertEqual(string.unicode_ljust('あいう', 10), 'あいう    ')
+            self.assertEqual(string.unicode_rjust('あいう', 10), '    あいう')
+            self.assertEqual(string.edge_just('abc', 'de', 10), 'abc     de')  # bypass
+            self.assertEqual(string.edge_just('a' * 40, 'b', 10), 'a' * 40 + ' b')
+            self.assertEqual(string.width_cache_info(), {'hits': 4, 'misses': 4, 'maxsize': 3, 'size': 3})
+            self.assertRaisesMessage(AssertionError, 'fillchar must be single-width char',
+                                     string.edge_just, 'あ', '', 10, 'あ')
+        finally:
+            string.set_width_cache_size(0)
+        self.assertEqual(string.width_cache_info(), None)
+        self.assertRaisesMessage(AssertionError, 'maxsize must not be negative.', string.set_width_cache_size, -1)
+
+    def test_width_cache_threads(self):
+        words = ['あ%d' % i for i in range(50)]
+        errors = []
+
+        def work():
+            try:
+                for _ in range(100):
+                    for w in words:
+                        assert string.unicode_width(w) == len(w) + 1
+                        assert string.unicode_ljust(w, 100) == w + ' ' * (99 - len(w))
+            except Exception as e:
+                errors.append(e)
+
+        interval = sys.getswitchinterval() if hasattr(sys, 'getswitchinterval') else None
+        try:
+            string.set_width_cache_size(20)
+            if interval is not None:
+                sys.setswitchinterval(1e-6)
+            threads = [threading.Thread(target=work) for _ in range(8)]
+            for th in threads:
+                th.start()
+            for th in threads:
+                th.join()
+        finally:
+            if interval is not None:
+                sys.setswitchinterval(interval)
+            string.set_width_cache_size(0)
+        self.assertEqual(errors, [])
 
     def test_to_str(self):
         self.assertEqual(string.to_str(b'abc'), string.to_str('abc'))
@@ -45,6 +144,93 @@ class TestString(unittest.TestCase):
         self.assertEqual(string.to_bytes('あいう'), 'あいう'.encode('utf-8'))
         self.assertEqual(string.to_bytes(1.23), b'1.23')
 
+    def test_buffers(self):
+        data = 'あいう'.encode('utf-8')
+        for s in [bytearray(data), memoryview(data), memoryview(b'xx' + data)[2:]]:
+            self.assertTrue(string.is_strlike(s))
+            self.assertEqual(string.to_unicode(s), 'あいう')
+            self.assertEqual(string.to_unicode(s, 'utf-8'), 'あいう')
+            self.assertEqual(string.to_unicode(s, 'ascii', 'ignore'), '')
+            self.assertEqual(string.to_str(s), 'あいう' if six.PY3 else data)
+            self.assertEqual(string.to_bytes(s), data)
+            self.assertEqual(type(string.to_bytes(s)), bytes)
+            self.assertEqual(string.to_unicode_many([s, s], sep='-'), 'あいう-あいう')
+            self.assertEqual(string.unicode_decode(s, ['ascii', 'sjis', 'utf-8']), 'あいう')
+            self.assertEqual(string.detect_encoding(s, ['ascii', 'utf-8']), 'utf-8')
+            self.assertEqual(string.unicode_left(s, 4), data[:4])
+            self.assertEqual(string.unicode_right(s, 4), data[-4:])
+            self.assertEqual(string.unicode_width(s), 9)
+
+        try:
+            string.set_width_cache_size(3)
+            for _ in range(2):
+                for s in [bytearray(data), memoryview(data)]:
+                    self.assertEqual(string.edge_just(s, b'x' * 32, 43, b'-'), data + b'--' + b'x' * 32)
+        finally:
+            string.set_width_cache_size(0)
+
+        self.assertEqual(string.to_unicode(memoryview('あいう'.encode('sjis')), 'sjis'), 'あいう')
+        self.assertEqual(string.detect_encoding(memoryview(b'abc'), ['ascii']), 'ascii')
+        self.assertEqual(string.detect_encoding(memoryview(codecs.BOM_UTF8 + data), ['ascii', 'utf-8-sig']),
+                         'utf-8-sig')
+        self.assertEqual(string.unicode_decode(memoryview(('a' * 100000).encode('sjis') + data), ['sjis', 'utf-8']),
+                         'a' * 100000 + 'あいう')
+        self.assertRaisesRegexp(
+            UnicodeDecodeError, "'ascii' codec can't decode",
+            string.unicode_decode, memoryview(data), ['ascii', 'sjis'])
+
+    def test_unchecked_conversions(self):
+        for s in [b'abc', 'abc', 'あいう', 'あいう'.encode('utf-8'), 1.23, None, ['x']]:
+            for encoding in [None, '', 'utf-8', 'UTF8', 'sjis', 'euc-jp']:
+                if isinstance(s, bytes) and encoding not in (None, '', 'utf-8', 'UTF8'):
+                    continue
+                self.assertEqual(string.to_unicode_unchecked(s, encoding), string.to_unicode(s, encoding))
+                self.assertEqual(string.to_str_unchecked(s, encoding), string.to_str(s, encoding))
+                self.assertEqual(string.to_bytes_unchecked(s, encoding), string.to_bytes(s, encoding))
+
+        self.assertEqual(string.to_bytes_unchecked('あいう', 'sjis'), 'あいう'.encode('sjis'))
+        self.assertEqual(string.to_unicode_unchecked('あいう'.encode('sjis'), 'sjis'), 'あいう')
+        self.assertEqual(string.to_bytes_unchecked('あいう', 'ascii', 'ignore'), b'')
+        self.assertRaises(UnicodeEncodeError, string.to_bytes_unchecked, 'あいう', 'ascii')
+        self.assertRaises(LookupError, string.to_bytes_unchecked, 'あいう', 'no-such-encoding')
+
+    @unittest.base_unittest.skipUnless(six.PY3, 'requires Python 3')
+    def test_conversions_non_text_encoding(self):
+        self.assertRaises(LookupError, string.to_bytes, 'abc', 'rot13')
+        self.assertRaises(LookupError, string.to_unicode, b'6162', 'hex')
+        self.assertRaises(LookupError, string.to_unicode, memoryview(b'6162'), 'hex')
+        self.assertRaises(LookupError, string.to_bytes_unchecked, 'abc', 'rot13')
+        self.assertRaises(LookupError, string.to_unicode_unchecked, b'6162', 'hex')
+        self.assertRaises(LookupError, string.to_unicode_many, [b'6162'], 'hex')
+        self.assertRaises(LookupError, string.to_bytes_many, ['abc'], 'rot13')
+
+    def test_to_unicode_many(self):
+        xs = [b'abc', 'あいう', 'あいう'.encode('sjis'), 1.23]
+        self.assertEqual(string.to_unicode_many([]), [])
+        self.assertEqual(string.to_unicode_many(xs[:2] + xs[3:]), ['abc', 'あいう', '1.23'])
+        self.assertEqual(string.to_unicode_many(xs, 'sjis'), ['abc', 'あいう', 'あいう', '1.23'])
+        self.assertEqual(string.to_unicode_many(xs, 'ascii', 'ignore'), ['abc', 'あいう', '', '1.23'])
+        self.assertEqual(string.to_unicode_many(iter(xs), 'sjis', sep='\n'), 'abc\nあいう\nあいう\n1.23')
+        self.assertEqual(string.to_unicode_many(iter(xs), 'sjis', sep=b','), 'abc,あいう,あいう,1.23')
+
+        it = string.to_unicode_many(iter(xs), 'sjis', lazy=True)
+        self.assertEqual(next(it), 'abc')
+        self.assertEqual(list(it), ['あいう', 'あいう', '1.23'])
+
+    def test_to_bytes_many(self):
+        xs = [b'abc', 'あいう', 'あいう'.encode('sjis'), 1.23]
+        self.assertEqual(string.to_bytes_many([]), [])
+        self.assertEqual(string.to_bytes_many(xs), [b'abc', 'あいう'.encode('utf-8'), 'あいう'.encode('sjis'), b'1.23'])
+        self.assertEqual(string.to_bytes_many(xs, 'sjis'), [b'abc', 'あいう'.encode('sjis'), 'あいう'.encode('sjis'),
+                                                            b'1.23'])
+        self.assertEqual(string.to_bytes_many(xs, 'ascii', 'ignore'), [b'abc', b'', 'あいう'.encode('sjis'), b'1.23'])
+        self.assertEqual(string.to_bytes_many(iter(['a', 'b', 'c']), sep=b'\n'), b'a\nb\nc')
+        self.assertEqual(string.to_bytes_many(iter(['あ', 'い']), 'sjis', sep='・'), 'あ・い'.encode('sjis'))
+
+        it = string.to_bytes_many(iter(xs), lazy=True)
+        self.assertEqual(next(it), b'abc')
+        self.assertRaises(UnicodeEncodeError, list, string.to_bytes_many(iter(xs), 'ascii', lazy=True))
+
     def test_edge_just(self):
         self.assertEqual(string.edge_just('', '', 0), ' ')
         self.assertEqual(string.edge_just('', '', -1), ' ')
@@ -125,6 +311,68 @@ class TestString(unittest.TestCase):
         self.assertEqual(string.unicode_right('あxいxうxえxお', 4), 'xお')
         self.assertEqual(string.unicode_right('あxいxうxえxお', 5), 'えxお')
 
+    def test_format_table(self):
+        rows = [['a', 'あいう', 1], ['xyz', 'b'], ['long text', 'ｱｲｳ', 12345]]
+        self.assertEqual(string.format_table([]), '')
+        self.assertEqual(string.format_table(rows), '\n'.join([
+            'a         あいう 1    ',
+            'xyz       b           ',
+            'long text ｱｲｳ    12345',
+        ]) + '\n')
+        self.assertEqual(string.format_table(rows, ['l', 'r', 'r'], [5, None, 3], sep='|', newline='\r\n'), ''.join([
+            'a    |あいう|  1\r\n',
+            'xyz  |     b|   \r\n',
+            'long |   ｱｲｳ|345\r\n',
+        ]))
+        self.assertEqual(string.format_table([('a', 'b'), ('c', 'd')]), 'a b\nc d\n')
+        self.assertEqual(string.format_table([['あいう']], max_widths=[4]), 'あい\n')
+        self.assertEqual(string.format_table([['あいう', 'x']], max_widths=[3]), 'あ  x\n')
+        self.assertRaisesRegexp(AssertionError, 'align must be l or r, not c.', string.format_table, rows, ['c'])
+
+    def test_iter_table_rows(self):
+        rows = iter([['a', 'あいう', 1], ('xyz', 'b'), ['long text', 'ｱｲｳ', 12345, 'extra']])
+        self.assertEqual(list(string.iter_table_rows(rows, [4, 4, 3], ['l', 'r', 'r'])), [
+            'a    いう   1',
+            'xyz     b    ',
+            'long  ｱｲｳ 345',
+        ])
+        self.assertEqual(list(string.iter_table_rows([], [1])), [])
+
+    def test_width_index(self):
+        index = string.WidthIndex('あいうabc')
+        self.assertEqual(index.width, 9)
+        self.assertEqual(index.left(-1), '')
+        self.assertEqual(index.left(0), '')
+        self.assertEqual(index.left(5), 'あい')
+        self.assertEqual(index.left(100), 'あいうabc')
+        self.assertEqual(index.right(-1), '')
+        self.assertEqual(index.right(4), 'abc')
+        self.assertEqual(index.right(5), 'うabc')
+        self.assertEqual(index.right(100), 'あいうabc')
+        self.assertEqual(index.slice_by_columns(2, 7), 'いうa')
+        self.assertEqual(index.slice_by_columns(1, 7), 'いうa')
+        self.assertEqual(index.slice_by_columns(3, 5), '')
+        self.assertEqual(index.slice_by_columns(5, 3), '')
+        self.assertEqual(index.slice_by_columns(0, 100), 'あいうabc')
+        self.assertEqual([index.column_of(i) for i in range(7)], [0, 2, 4, 6, 7, 8, 9])
+
+        index = string.WidthIndex('')
+        self.assertEqual(index.width, 0)
+        self.assertEqual(index.left(3), '')
+        self.assertEqual(index.right(3), '')
+
+        index = string.WidthIndex('abc')
+        self.assertEqual(index.slice_by_columns(1, 2), 'b')
+
+    def test_unicode_left_right_long(self):
+        s = 'あxいxうxえxお' * 200
+        for width in [-1, 0, 1, 2, 3, 999, 1000, 3000, 3001]:
+            self.assertEqual(string.unicode_left(s, width), string.WidthIndex(s).left(width))
+            self.assertEqual(string.unicode_right(s, width), string.WidthIndex(s).right(width))
+        self.assertEqual(string.unicode_left(s, 5), 'あxい')
+        self.assertEqual(string.unicode_right(s, 5), 'えxお')
+        self.assertEqual(string.unicode_left(s, 3000), s)
+
     def test_unicode_decode(self):
         self.assertRaisesRegexp(AssertionError, 'encodings must not be empty.', string.unicode_decode, 'abc', [])
         self.assertEqual(string.unicode_decode(b'abc', 'ascii'), 'abc')
@@ -143,3 +391,91 @@ class TestString(unittest.TestCase):
         self.assertRaisesRegexp(
             UnicodeDecodeError, "'shift_jis' codec can't decode",
             string.unicode_decode, 'あいうえお'.encode('utf-8'), ['sjis', 'ascii'])
+
+    def test_unicode_decode_detection(self):
+        s = 'あいうえお'
+        t = 'a' * 100000
+        self.assertEqual(string.unicode_decode((t + s).encode('sjis'), ['utf-8', 'sjis']), t + s)
+        self.assertEqual(string.unicode_decode((s + t).encode('utf-8'), ['sjis', 'utf-8']), s + t)
+        self.assertEqual(string.unicode_decode((t + s).encode('utf-8'), ['ascii', 'sjis', 'utf-8']), t + s)
+        self.assertRaisesRegexp(UnicodeDecodeError, "'ascii' codec can't decode",
+                                string.unicode_decode, (t + s).encode('utf-8'), ['ascii', 'utf-16-le'])
+        self.assertEqual(string.unicode_decode(codecs.BOM_UTF8 + s.encode('utf-8'), ['utf-8', 'utf-8-sig']),
+                         '\ufeff' + s)
+
+    def test_detect_encoding(self):
+        s = 'あいうえお'
+        self.assertEqual(string.detect_encoding(b'', ['utf-8', 'sjis']), 'utf-8')
+        self.assertEqual(string.detect_encoding(b'abc', ['utf-16', 'utf-8']), 'utf-8')
+        self.assertEqual(string.detect_encoding(b'abcd', ['utf-16', 'utf-8']), 'utf-16')
+        self.assertEqual(string.detect_encoding(s.encode('utf-8'), ['ascii', 'sjis', 'utf-8']), 'utf-8')
+        self.assertEqual(string.detect_encoding(s.encode('sjis'), ['ascii', 'utf-8', 'sjis']), 'sjis')
+        self.assertEqual(string.detect_encoding(s.encode('sjis'), ['ascii', 'utf-8']), None)
+
+        # decide on the sample
+        data = ('a' * 10 + s).encode('utf-8')
+        self.assertEqual(string.detect_encoding(data, ['ascii', 'utf-8'], sample_bytes=10), 'ascii')
+        self.assertEqual(string.detect_encoding(data, ['ascii', 'utf-8'], sample_bytes=11), 'utf-8')
+        self.assertEqual(string.detect_encoding(s.encode('utf-8'), ['sjis', 'utf-8'], sample_bytes=1), 'sjis')
+        self.assertEqual(string.detect_encoding(s.encode('utf-8'), ['utf-8'], sample_bytes=1), 'utf-8')
+
+        # byte order mark
+        self.assertEqual(string.detect_encoding(codecs.BOM_UTF8 + b'abc', ['ascii', 'utf-8']), 'utf-8')
+        self.assertEqual(string.detect_encoding(codecs.BOM_UTF8 + b'abc', ['utf-8', 'utf-8-sig']), 'utf-8-sig')
+        self.assertEqual(string.detect_encoding(s.encode('utf-16'), ['utf-8', 'sjis', 'utf-16']), 'utf-16')
+        self.assertEqual(string.detect_encoding(s.encode('utf-32'), ['utf-16', 'UTF-32']), 'UTF-32')
+        self.assertEqual(string.detect_encoding(s.encode('utf-16'), ['latin-1', 'utf-16']), 'utf-16')
+        self.assertEqual(string.detect_encoding(s.encode('utf-16'), ['latin-1', 'utf-16'], use_bom=False), 'latin-1')
+
+        # the sample ends in the middle of a UTF-7 shift sequence
+        u = 'a' * 65530 + 'あいうえおかきくけこ' * 20
+        self.assertEqual(string.detect_encoding(u.encode('utf-7'), ['utf-7', 'latin-1']), 'utf-7')
+        self.assertEqual(string.unicode_decode(u.encode('utf-7'), ['utf-7', 'latin-1']), u)
+        self.assertRaisesRegexp(AssertionError, 'sample_bytes must be positive.',
+                                string.detect_encoding, b'', ['ascii'], 0)
+
+    def test_unicode_decode_stream(self):
+        def decode(data, encoding_list, **kwargs):
+            return ''.join(string.unicode_decode_stream(data, encoding_list, **kwargs))
+
+        s = 'あいうえお'
+        self.assertEqual(decode([], 'ascii'), '')
+        self.assertEqual(decode([b'abc'], 'ascii'), 'abc')
+        self.assertEqual(decode([b'a', b'', b'bc'], ['ascii']), 'abc')
+        self.assertEqual(decode(io.BytesIO(s.encode('utf-8')), ['ascii', 'sjis', 'utf-8'], chunk_size=1), s)
+        self.assertEqual(decode(io.BytesIO(s.encode('sjis')), ['ascii', 'utf-8', 'sjis'], chunk_size=3), s)
+        self.assertEqual(decode(io.BytesIO(s.encode('utf-8') * 100), ['utf-8', 'sjis'], probe_size=10), s * 100)
+
+        # decoding is lazy
+        def gen():
+            yield s.encode('utf-8')
+            raise ValueError('must not be consumed')
+
+        it = string.unicode_decode_stream(gen(), ['sjis', 'utf-8'], probe_size=3)
+        self.assertEqual(next(it), s)
+
+        # probing stops when only one encoding survives
+        self.assertEqual(next(string.unicode_decode_stream(gen(), 'utf-8')), s)
+        self.assertEqual(next(string.unicode_decode_stream(gen(), ['ascii', 'utf-8', 'utf-8'])), s)
+
+        # the encoding is chosen within the probed bytes
+        data = ('a' * 10 + s).encode('utf-8')
+        self.assertEqual(decode([data[:10], data[10:]], ['sjis', 'utf-8'], probe_size=20), 'a' * 10 + s)
+        self.assertRaisesRegexp(
+            UnicodeDecodeError, "'shift_jis' codec can't decode",
+            decode, [data[:10], data[10:]], ['sjis', 'utf-8'], probe_size=10)
+
+        self.assertRaisesRegexp(
+            UnicodeDecodeError, "'ascii' codec can't decode",
+            decode, [s.encode('utf-8')], ['ascii', 'sjis'])
+        self.assertRaisesRegexp(
+            UnicodeDecodeError, "'utf-?8' codec can't decode",
+            decode, [s.encode('utf-8')[:-1]], ['utf-8', 'ascii'])
+        self.assertRaisesRegexp(AssertionError, 'encodings must not be empty.', decode, [], [])
+
+    def test_unicode_decode_stream_file(self):
+        path = os.path.join('tests', 'resources', 'sjis_ja.txt')
+        with io.open(path, 'rb') as f:
+            actual = ''.join(string.unicode_decode_stream(f, ['utf-8', 'sjis'], chunk_size=4))
+        with io.open(path, encoding='sjis', newline='') as f:
+            self.assertEqual(actual, f.read())
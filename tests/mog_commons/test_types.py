@@ -1,10 +1,21 @@
 # -*- coding: utf-8 -*-
 from __future__ import division, print_function, absolute_import, unicode_literals
 
+import os
+import sys
 import six
 from mog_commons import unittest
 from mog_commons.types import *
-from mog_commons.types import _get_name
+from mog_commons.types import _get_name, _compile_checker
+
+if sys.version_info < (2, 7):
+    STR_TYPE = '(basestring|str|bytearray)'
+elif six.PY2:
+    STR_TYPE = '(basestring|str|bytearray|memoryview)'
+else:
+    STR_TYPE = '(str|bytes|bytearray|memoryview)'
+
+UNICODE_TYPE = 'unicode' if six.PY2 else 'str'
 
 
 class TestTypes(unittest.TestCase):
@@ -49,7 +60,7 @@ class TestTypes(unittest.TestCase):
         pass
 
     def test_types(self):
-        str_type = '(basestring|str)' if six.PY2 else '(str|bytes)'
+        str_type = STR_TYPE
 
         self.assertEqual(self.bin_func(10, 20), 30)
         self.assertRaisesMessage(TypeError, 'x must be int, not dict.', self.bin_func, {}, 20)
@@ -73,12 +84,124 @@ class TestTypes(unittest.TestCase):
         self.assertRaisesMessage(TypeError, 'xs must be (list(int)|NoneType), not list.',
                                  self.optional_func2, [1, 2, 3.4])
 
+    def test_types_binding(self):
+        self.assertEqual(self.complex_func(123, [1], 10), 1)
+        self.assertEqual(self.complex_func(p3=10, p2=[1], p1=123, p5='abc'), 1)
+        self.assertEqual(self.complex_func(123, [1], 10, 'a', 'b', [], [{}], x=1.2, y=3.4), 1)
+        self.assertRaisesMessage(TypeError, 'p3 must be int, not float.', self.complex_func, 123, [1], p3=1.0)
+        self.assertRaisesMessage(TypeError, 'k must be tuple(list(dict(%s->set(int)))), not tuple.' % STR_TYPE,
+                                 self.complex_func, 123, [1], 10, 'a', 'b', [], [1])
+        self.assertRaisesMessage(TypeError, 'kw must be dict(%s->float), not dict.' % STR_TYPE,
+                                 self.complex_func, 123, [1], 10, x=1)
+
+        # missing arguments are reported in the same way as the original function
+        self.assertRaises(TypeError, self.bin_func, 10)
+
     def test_types_error(self):
         self.assertRaisesMessage(AssertionError, 'Not found argument: a', self.err_func1, 123)
         self.assertRaisesMessage(AssertionError, 'You can specify at most one return type.', self.err_func2)
 
+    def test_types_mode(self):
+        def f(x):
+            return x
+
+        self.assertEqual(types.get_mode(), ('full', 100))
+        try:
+            types.set_mode('off')
+            self.assertTrue(types(x=int)(f) is f)
+
+            # per-decorator override
+            g = types(x=int, _mode='full')(f)
+            self.assertFalse(g is f)
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+
+            types.set_mode('sampled', 3)
+            self.assertEqual(types.get_mode(), ('sampled', 3))
+            g = types(x=int)(f)
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+            self.assertEqual(g('a'), 'a')
+            self.assertEqual(g('a'), 'a')
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+
+            # switching mode affects decorated functions
+            types.set_mode('off')
+            self.assertEqual(g('a'), 'a')
+            types.set_mode('full')
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+
+            g = types(x=int, _mode='sampled', _sample_interval=2)(f)
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+            self.assertEqual(g('a'), 'a')
+            self.assertRaisesMessage(TypeError, 'x must be int, not %s.' % UNICODE_TYPE, g, 'a')
+        finally:
+            types.set_mode('full', 100)
+
+    def test_types_mode_error(self):
+        self.assertRaisesMessage(AssertionError, 'Invalid mode: xxx', types.set_mode, 'xxx')
+        self.assertRaisesMessage(AssertionError, 'sample_interval must be positive.', types.set_mode, 'full', 0)
+        self.assertRaisesMessage(AssertionError, 'Invalid mode: xxx', types, x=int, _mode='xxx')
+
+    def test_load_mode_from_env(self):
+        import warnings
+        from mog_commons import types as types_module
+
+        environ = dict(os.environ)
+        try:
+            for mode, interval, expected in [
+                ('sampled', '5', ('sampled', 5)),
+                ('of', None, ('full', 100)),
+                ('off', '0', ('off', 100)),
+                (None, 'x', ('full', 100)),
+            ]:
+                os.environ.pop('MOG_COMMONS_TYPES_MODE', None)
+                os.environ.pop('MOG_COMMONS_TYPES_SAMPLE_INTERVAL', None)
+                if mode:
+                    os.environ['MOG_COMMONS_TYPES_MODE'] = mode
+                if interval:
+                    os.environ['MOG_COMMONS_TYPES_SAMPLE_INTERVAL'] = interval
+
+                with warnings.catch_warnings(record=True) as ws:
+                    warnings.simplefilter('always')
+                    getattr(types_module, '_load_mode_from_env')()
+                self.assertEqual(types.get_mode(), expected)
+                self.assertEqual(len(ws), 0 if mode == 'sampled' else 1)
+                types.set_mode('full', 100)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+            types.set_mode('full', 100)
+
+    def test_load_profile_from_env(self):
+        import warnings
+        from mog_commons import types as types_module
+
+        environ = dict(os.environ)
+        try:
+            for value, expected, num_warnings in [
+                (None, False, 0),
+                ('', False, 0),
+                ('0', False, 0),
+                ('false', False, 0),
+                ('OFF', False, 0),
+                ('1', True, 0),
+                ('True', True, 0),
+                ('on', True, 0),
+                ('yes please', False, 1),
+            ]:
+                os.environ.pop('MOG_COMMONS_TYPES_PROFILE', None)
+                if value is not None:
+                    os.environ['MOG_COMMONS_TYPES_PROFILE'] = value
+
+                with warnings.catch_warnings(record=True) as ws:
+                    warnings.simplefilter('always')
+                    self.assertEqual(getattr(types_module, '_load_profile_from_env')(), expected)
+                self.assertEqual(len(ws), num_warnings)
+        finally:
+            os.environ.clear()
+            os.environ.update(environ)
+
     def test_get_name(self):
-        str_type = '(basestring|str)' if six.PY2 else '(str|bytes)'
+        str_type = STR_TYPE
         unicode_type = 'unicode' if six.PY2 else 'str'
 
         self.assertEqual(_get_name(int), 'int')
@@ -92,3 +215,257 @@ class TestTypes(unittest.TestCase):
         self.assertEqual(_get_name(KwArg(str)), 'dict(%s->str)' % str_type)
         self.assertEqual(_get_name(KwArg(ListOf(DictOf(float, SetOf((str, TupleOf(Unicode))))))),
                          'dict(%s->list(dict(float->set((str|tuple(%s))))))' % (str_type, unicode_type))
+
+    def test_compile_checker(self):
+        f = _compile_checker(int)
+        self.assertTrue(f(1))
+        self.assertFalse(f('1'))
+
+        f = _compile_checker(Option(String))
+        self.assertTrue(f(None))
+        self.assertTrue(f('abc'))
+        self.assertFalse(f(1))
+
+        spec = DictOf(String, ListOf(Option(int)))
+        f = _compile_checker(spec)
+        self.assertTrue(f is spec.checker())
+        self.assertTrue(f({}))
+        self.assertTrue(f({'a': [], 'b': [1, None, 3]}))
+        self.assertFalse(f({'a': [1, 2.0]}))
+        self.assertFalse(f({1: [1]}))
+        self.assertFalse(f([]))
+
+        f = _compile_checker((int, ListOf(int), (TupleOf(String), type(None))))
+        self.assertTrue(f(1))
+        self.assertTrue(f([1, 2]))
+        self.assertTrue(f(('a', 'b')))
+        self.assertTrue(f(None))
+        self.assertFalse(f([1, 'a']))
+        self.assertFalse(f((1,)))
+        self.assertFalse(f(1.0))
+
+        f = _compile_checker(SetOf(DictOf(int, (float, ListOf(int)))))
+        self.assertTrue(f(set()))
+        self.assertFalse(f(frozenset()))
+        self.assertTrue(SetOf(int).check(set([1, 2])))
+        self.assertFalse(SetOf(int).check(set([1, 'a'])))
+
+    def test_check_strategy(self):
+        xs = list(range(1000)) + ['x']
+
+        self.assertFalse(ListOf(int).check(xs))
+        self.assertTrue(ListOf(int, check='first:1000').check(xs))
+        self.assertFalse(ListOf(int, check='first:1001').check(xs))
+        self.assertTrue(ListOf(int, check='none').check(xs))
+        self.assertFalse(ListOf(int, check='none').check(tuple(xs)))
+        self.assertTrue(ListOf(int, check='random:10').check(list(range(1000))))
+        self.assertFalse(ListOf(int, check='random:1000').check(xs[:-2] + ['x']))
+        self.assertFalse(ListOf(int, check='random:2000').check(xs))
+
+        self.assertTrue(TupleOf(int, check='random:3').check((1, 2, 3, 4, 5)))
+        self.assertFalse(TupleOf(int, check='random:5').check((1, 2, 3, 4, 'x')))
+        self.assertTrue(SetOf(int, check='random:3').check(set([1, 2, 3, 4, 5])))
+        self.assertFalse(SetOf(int, check='random:4').check(set(['a', 'b', 'c', 'd', 'e'])))
+        self.assertTrue(SetOf(int, check='first:2').check(set([1, 2, 3, 4, 5])))
+
+        d = dict((i, i) for i in range(100))
+        self.assertTrue(DictOf(int, int, check='random:10').check(d))
+        self.assertTrue(DictOf(int, ListOf(int), check='none').check(d))
+        self.assertTrue(DictOf(int, String, check='first:1').check({1: 'a'}))
+        self.assertFalse(DictOf(int, ListOf(int), check='first:1').check({1: 'a'}))
+        self.assertFalse(DictOf(int, String, check='random:100').check(dict(d, x='a')))
+
+    def test_check_strategy_error(self):
+        for check in ['', 'xxx', 'first', 'first:', 'first:0', 'random:x', 'none:1', 'all:10']:
+            self.assertRaisesMessage(AssertionError, 'Invalid check strategy: %s' % check, ListOf, int, check)
+        self.assertRaisesMessage(AssertionError, 'Invalid check strategy: x', DictOf, int, int, 'x')
+
+    def test_result_cache(self):
+        spec = TupleOf(TupleOf(int))
+        xs = tuple((i,) * 10 for i in range(10))
+
+        self.assertTrue(spec.is_immutable())
+        self.assertFalse(TupleOf(ListOf(int)).is_immutable())
+        self.assertFalse(TupleOf(int, check='first:10').is_immutable())
+        self.assertFalse(ListOf(int).is_immutable())
+        self.assertFalse(DictOf(int, int).is_immutable())
+
+        self.assertEqual(types.cache_info(), None)
+        try:
+            types.set_cache_size(2)
+            self.assertTrue(spec.check(xs))
+            self.assertEqual(types.cache_info(), {'hits': 0, 'misses': 11, 'maxsize': 2, 'size': 2})
+            self.assertTrue(spec.check(xs))
+            self.assertEqual(types.cache_info(), {'hits': 1, 'misses': 11, 'maxsize': 2, 'size': 2})
+
+            # small containers bypass the cache
+            self.assertFalse(spec.check(((1,), ('a',))))
+            self.assertFalse(spec.check([(1,)]))
+            self.assertEqual(types.cache_info(), {'hits': 1, 'misses': 11, 'maxsize': 2, 'size': 2})
+
+            ys = xs + (('a',) * 10,)
+            self.assertFalse(spec.check(ys))
+            self.assertFalse(spec.check(ys))
+            self.assertEqual(types.cache_info(), {'hits': 2, 'misses': 23, 'maxsize': 2, 'size': 2})
+        finally:
+            types.set_cache_size(0)
+        self.assertEqual(types.cache_info(), None)
+        self.assertRaisesMessage(AssertionError, 'maxsize must not be negative.', types.set_cache_size, -1)
+
+    def test_profile(self):
+        @types(int, x=ListOf(int))
+        def f(x):
+            return len(x)
+
+        name = '%s.%s' % (__name__, getattr(f, '__qualname__', 'f'))
+        self.assertEqual(types.get_profile(), [])
+        try:
+            types.set_profile(True)
+            self.assertEqual(f([1, 2, 3]), 3)
+            self.assertEqual(f([]), 0)
+            self.assertRaises(TypeError, f, ['a'])
+
+            profile = types.get_profile()
+            self.assertEqual(len(profile), 1)
+            self.assertEqual(profile[0][:2], (name, 2))
+            self.assertTrue(profile[0][2] > 0)
+            self.assertTrue(profile[0][3] > 0)
+
+            lines = types.report().splitlines()
+            self.assertEqual(len(lines), 2)
+            self.assertEqual(lines[0].split(), ['calls', 'check(s)', 'body(s)', 'ratio', 'function'])
+            self.assertEqual(lines[1].split()[0], '2')
+            self.assertEqual(lines[1].split()[-1], name)
+            self.assertEqual(len(types.report(limit=0).splitlines()), 1)
+
+            types.set_profile(False)
+            f([])
+            self.assertEqual(types.get_profile()[0][:2], (name, 2))
+        finally:
+            types.set_profile(False)
+            types.reset_profile()
+        self.assertEqual(types.get_profile(), [])
+
+    def test_profile_registry(self):
+        import gc
+        from mog_commons import types as types_module
+        registry = getattr(types_module, '_profile_registry')
+
+        def decorate():
+            @types(x=int)
+            def g(x):
+                return x
+
+            return g
+
+        # functions are not registered until profiled
+        for _ in range(100):
+            decorate()(1)
+        self.assertEqual(len(registry), 0)
+
+        try:
+            types.set_profile(True)
+            fs = [decorate() for _ in range(3)]
+            for g in fs:
+                g(1)
+            self.assertEqual(len(registry), 3)
+
+            # entries are removed with the functions
+            del fs, g
+            gc.collect()
+            self.assertEqual(len(registry), 0)
+        finally:
+            types.set_profile(False)
+            types.reset_profile()
+
+    def test_validate_many(self):
+        str_type = STR_TYPE
+        spec = DictOf(String, int)
+
+        self.assertEqual(validate_many(spec, []), [])
+        self.assertEqual(validate_many(spec, ({'a': i} for i in range(100))), [])
+        self.assertEqual(validate_many(spec, [{'a': 1}, {'b': 'x'}, [], {}]), [
+            (1, '[%r] must be int, not %s.' % ('b', UNICODE_TYPE)),
+            (2, 'must be dict(%s->int), not list.' % str_type),
+        ])
+        self.assertEqual(validate_many(ListOf(DictOf(String, ListOf(int))), [[{'a': [1]}, {'b': [2, 'x']}]]), [
+            (0, '[1][%r][1] must be int, not %s.' % ('b', UNICODE_TYPE)),
+        ])
+        self.assertEqual(validate_many(int, iter([1, 'a', 2.0, 3]), max_errors=1),
+                         [(1, 'must be int, not %s.' % UNICODE_TYPE)])
+        self.assertRaisesMessage(AssertionError, 'max_errors must be positive.', validate_many, int, [], 0)
+
+    def test_iter_validated(self):
+        consumed = []
+
+        def gen():
+            for x in [1, 2, 'a', 4]:
+                consumed.append(x)
+                yield x
+
+        it = iter_validated(int, gen())
+        self.assertEqual(next(it), 1)
+        self.assertEqual(consumed, [1])
+        self.assertEqual(next(it), 2)
+        self.assertRaisesMessage(TypeError, 'item 2 must be int, not %s.' % UNICODE_TYPE, next, it)
+        self.assertEqual(consumed, [1, 2, 'a'])
+        self.assertEqual(list(iter_validated(TupleOf(int), [(1,), (2, 3)])), [(1,), (2, 3)])
+
+    @unittest.base_unittest.skipUnless(sys.version_info >= (3, 6), 'requires Python 3.6+')
+    def test_types_coroutine(self):
+        import inspect
+        from tests.mog_commons.async_functions import coroutine_func, bad_coroutine_func, run
+
+        self.assertTrue(inspect.iscoroutinefunction(coroutine_func))
+        self.assertEqual(run(coroutine_func(3)), 6)
+        self.assertRaisesMessage(TypeError, 'x must be int, not str.', run, coroutine_func('3'))
+        self.assertRaisesMessage(TypeError, 'must return int, not str.', run, bad_coroutine_func(3))
+
+    @unittest.base_unittest.skipUnless(sys.version_info >= (3, 6), 'requires Python 3.6+')
+    def test_types_async_generator(self):
+        import inspect
+        from tests.mog_commons.async_functions import async_gen_func, echo_gen_func, run, collect, talk
+
+        self.assertTrue(inspect.isasyncgenfunction(async_gen_func))
+        self.assertEqual(run(collect(async_gen_func(3))), [0, 1, 2])
+        self.assertRaisesMessage(TypeError, 'n must be int, not str.', run, collect(async_gen_func('3')))
+        self.assertRaisesMessage(TypeError, 'must return int, not str.', run, collect(async_gen_func(3, 1)))
+        self.assertEqual(run(talk(echo_gen_func(), [1, 2])), [0, 1, 2, -1])
+
+        # the original generator is closed when the check fails
+        from tests.mog_commons.async_functions import closing_gen_func, closed
+        self.assertRaisesMessage(TypeError, 'must return int, not str.', run, collect(closing_gen_func()))
+        self.assertEqual(closed, [True])
+
+    def test_type_check_error(self):
+        @types(ListOf(int), x=ListOf(DictOf(String, Option(int))), y=(int, SetOf(TupleOf(int))))
+        def f(x, y=0):
+            return ['a']
+
+        with self.assertRaises(TypeCheckError) as cm:
+            f([{'a': 1}, {'b': None, 'key': 'v'}])
+        e = cm.exception
+        self.assertTrue(isinstance(e, TypeError))
+        self.assertEqual(e.arg_name, 'x')
+        self.assertEqual(e.actual_type, list)
+        self.assertEqual(e.path, "x[1][%r]" % 'key')
+        self.assertEqual(e.detail, "x[1][%r] must be (int|NoneType), not %s." % ('key', UNICODE_TYPE))
+
+        with self.assertRaises(TypeCheckError) as cm:
+            f([{1: 1}])
+        self.assertEqual(cm.exception.path, 'x[0]{1}')
+        self.assertEqual(cm.exception.detail, 'x[0]{1} must be %s, not int.' % _get_name(String))
+
+        with self.assertRaises(TypeCheckError) as cm:
+            f([], set([(1, 2, 'c')]))
+        self.assertEqual(cm.exception.detail, "y{%r}[2] must be int, not %s." % ((1, 2, 'c'), UNICODE_TYPE))
+
+        with self.assertRaises(TypeCheckError) as cm:
+            f([], 1.0)
+        self.assertEqual(str(cm.exception), 'y must be (int|set(tuple(int))), not float.')
+        self.assertEqual(cm.exception.path, 'y')
+
+        with self.assertRaises(TypeCheckError) as cm:
+            f([])
+        self.assertEqual(str(cm.exception), 'must return list(int), not list.')
+        self.assertEqual(cm.exception.detail, 'return value[0] must be int, not %s.' % UNICODE_TYPE)